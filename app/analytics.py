@@ -1,7 +1,7 @@
 import pandas as pd
 from datetime import datetime, timedelta
-from sqlalchemy import func, extract
-from .models import db, User, Product, Stock, Analyzis, Order, ProductOrder
+from sqlalchemy import func, extract, select, union_all
+from .models import db, User, Product, Stock, Analyzis, Order, ProductOrder, StockOrder
 
 # Define a consistent color palette based on CSS variables
 COLORS = {
@@ -16,21 +16,36 @@ COLORS = {
 
 def get_sales_trends(start_date=None, end_date=None, category=None, user_role=None):
     """График трендов продаж с фильтрами, возвращает данные для chart.js"""
-    query = db.session.query(
-        Order.created_at_order.label('date'),
-        func.sum(ProductOrder.count * Product.price_product).label('revenue'),
-        func.count(Order.id_order).label('orders_count')
-    ).join(ProductOrder, Order.id_order == ProductOrder.id_order)\
-     .join(Product, ProductOrder.id_product == Product.id_product)\
-     .join(User, Order.id_user == User.id_user)\
-     .filter(Order.status_order.in_(['approved', 'completed']))
+    if category:
+        # Выручка по категории считается по строкам заказов обоих типов, как и
+        # total_amount: производство - по товару строки, остатки - по товару партии
+        product_lines = select(ProductOrder.id_order, (ProductOrder.count * ProductOrder.price).label('amount'))\
+            .join(Product, ProductOrder.id_product == Product.id_product)\
+            .where(Product.category_product == category)
+        stock_lines = select(StockOrder.id_order, (StockOrder.count_order * StockOrder.price_order).label('amount'))\
+            .join(Stock, StockOrder.id_stock == Stock.id_stock)\
+            .join(Product, Stock.id_product == Product.id_product)\
+            .where(Product.category_product == category)
+        lines = union_all(product_lines, stock_lines).subquery()
+        query = db.session.query(
+            Order.created_at_order.label('date'),
+            func.sum(lines.c.amount).label('revenue'),
+            func.count(func.distinct(Order.id_order)).label('orders_count')
+        ).join(lines, Order.id_order == lines.c.id_order)
+    else:
+        query = db.session.query(
+            Order.created_at_order.label('date'),
+            func.sum(Order.total_amount).label('revenue'),
+            func.count(Order.id_order).label('orders_count')
+        )
+
+    query = query.join(User, Order.id_user == User.id_user)\
+        .filter(Order.status_order.in_(['approved', 'completed']))
 
     if start_date:
         query = query.filter(Order.created_at_order >= start_date)
     if end_date:
         query = query.filter(Order.created_at_order <= end_date)
-    if category:
-        query = query.filter(Product.category_product == category)
     if user_role:
         query = query.filter(User.role_user == user_role)
 
@@ -126,7 +141,7 @@ def get_product_popularity(limit=10, start_date=None, end_date=None):
     query = db.session.query(
         Product.title_product,
         func.sum(ProductOrder.count).label('total_sold'),
-        func.sum(ProductOrder.count * Product.price_product).label('total_revenue')
+        func.sum(ProductOrder.count * ProductOrder.price).label('total_revenue')
     ).join(ProductOrder, Product.id_product == ProductOrder.id_product)\
      .join(Order, ProductOrder.id_order == Order.id_order)\
      .filter(Order.status_order.in_(['approved', 'completed']))
@@ -451,12 +466,10 @@ def get_revenue_analysis(start_date=None, end_date=None, group_by='month'):
 
     query = db.session.query(
         date_func.label('period'),
-        func.sum(ProductOrder.count * Product.price_product).label('revenue'),
-        func.count(func.distinct(Order.id_order)).label('orders'),
-        func.avg(ProductOrder.count * Product.price_product).label('avg_order_value')
-    ).join(ProductOrder, Order.id_order == ProductOrder.id_order)\
-     .join(Product, ProductOrder.id_product == Product.id_product)\
-     .filter(Order.status_order.in_(['approved', 'completed']))
+        func.sum(Order.total_amount).label('revenue'),
+        func.count(Order.id_order).label('orders'),
+        func.avg(Order.total_amount).label('avg_order_value')
+    ).filter(Order.status_order.in_(['approved', 'completed']))
 
     if start_date:
         query = query.filter(Order.created_at_order >= start_date)
@@ -581,15 +594,11 @@ def get_analyzis_visualization(product_id=None, metric_x='glitter', metric_y='vi
 
 def get_dashboard_metrics():
     """Метрики для дашборда"""
-    revenue_query = db.session.query(
-        func.sum(ProductOrder.count * Product.price_product).label('total_revenue')
-    ).join(Order, ProductOrder.id_order == Order.id_order)\
-     .join(Product, ProductOrder.id_product == Product.id_product)\
-     .filter(Order.status_order.in_(['approved', 'completed']))
-
-    revenue = revenue_query.scalar() or 0
-
-    orders_count = Order.query.filter(Order.status_order.in_(['approved', 'completed'])).count()
+    revenue, orders_count, avg_order_value = db.session.query(
+        func.sum(Order.total_amount),
+        func.count(Order.id_order),
+        func.avg(Order.total_amount)
+    ).filter(Order.status_order.in_(['approved', 'completed'])).one()
 
     active_users = User.query.filter(User.role_user == 'buyer').count()
 
@@ -611,19 +620,11 @@ def get_dashboard_metrics():
         Order.status_order.in_(['approved', 'completed'])
     ).count()
 
-    avg_order_query = db.session.query(
-        func.avg(ProductOrder.count * Product.price_product).label('avg_order')
-    ).join(Order, ProductOrder.id_order == Order.id_order)\
-     .join(Product, ProductOrder.id_product == Product.id_product)\
-     .filter(Order.status_order.in_(['approved', 'completed']))
-
-    avg_order_value = avg_order_query.scalar() or 0
-
     return {
-        'total_revenue': float(revenue),
+        'total_revenue': float(revenue or 0),
         'orders_count': orders_count,
         'active_users': active_users,
         'popular_products': popular_products.to_dict('records') if not popular_products.empty else [],
         'orders_this_month': orders_this_month,
-        'avg_order_value': float(avg_order_value)
+        'avg_order_value': float(avg_order_value or 0)
     }
@@ -1,6 +1,16 @@
 from .models import db, User, Product, Stock, Order, ProductOrder, StockOrder, Analyzis
+from .order_cache import bump_order_history_version, bump_order_history_versions, mark_orders_changed
+from .outbox import enqueue_event, enqueue_events, EVENT_ORDER_CREATED, EVENT_ORDER_STATUS_CHANGED
+from .stock_allocation import try_reserve_stock, allocate_fefo
+from .stock_ledger import record_movement, record_movements, MOVEMENT_RECEIPT, MOVEMENT_RESERVATION, MOVEMENT_SHIPMENT, MOVEMENT_CORRECTION
 from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, insert, or_, update, any_, bindparam, cast, column, literal, select, union_all, values
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 import hashlib
+import re
 import secrets
 
 def hash_password(password, salt=None):
@@ -45,7 +55,7 @@ def get_all_products():
 def get_product_by_id(product_id):
     return Product.query.get(product_id)
 
-def create_product(title, price, category, description, img_path, expiration_month, nomenclature):
+def create_product(title, price, category, description, img_path, expiration_month, nomenclature, reorder_threshold=10):
     product = Product(
         title_product=title,
         price_product=price,
@@ -54,7 +64,8 @@ def create_product(title, price, category, description, img_path, expiration_mon
         description_product=description,
         img_path_product=img_path,
         expiration_month_product=expiration_month,
-        nomenclature_product=nomenclature
+        nomenclature_product=nomenclature,
+        reorder_threshold_product=reorder_threshold
     )
     db.session.add(product)
     db.session.commit()
@@ -63,23 +74,18 @@ def create_product(title, price, category, description, img_path, expiration_mon
 def get_stock_by_product_id(product_id):
     return Stock.query.filter_by(id_product=product_id).first()
 
-def update_stock(product_id, qty, ral=None):
-    stock = get_stock_by_product_id(product_id)
-    if stock:
-        stock.count_stock = qty
-        if ral:
-            stock.ral_stock = ral
-        stock.date_stock = datetime.utcnow().date()
-    else:
-        stock = Stock(
-            id_product=product_id,
-            count_stock=qty,
-            ral_stock=ral,
-            date_stock=datetime.utcnow().date()
-        )
-        db.session.add(stock)
-    db.session.commit()
-    return stock
+def stock_expires_at(date_stock, expiration_month):
+    """Срок годности партии: дата производства плюс срок годности товара в месяцах"""
+    return date_stock + relativedelta(months=expiration_month)
+
+def update_product_stock_expiry(product):
+    """Пересчитывает expires_at_stock партий товара после смены срока годности (без commit)"""
+    db.session.execute(
+        update(Stock)
+        .where(Stock.id_product == product.id_product)
+        .values(expires_at_stock=cast(Stock.date_stock + func.make_interval(0, product.expiration_month_product), db.Date))
+        .execution_options(synchronize_session=False)
+    )
 
 def get_all_orders():
     return Order.query.all()
@@ -90,94 +96,448 @@ def get_orders_by_user(user_id):
 def get_order_by_id(order_id):
     return Order.query.get(order_id)
 
-def create_order(user_id, items, status='pending_moderation'):
-    from .models import Product
-    order = Order(
-        id_user=user_id,
-        status_order=status,
-        created_at_order=datetime.utcnow().date()
-    )
-    db.session.add(order)
-    db.session.flush()  # to get order.id_order
+# RAL в номенклатуре товара ("... RAL 7024")
+RAL_IN_NOMENCLATURE = re.compile(r'RAL (\d+)')
+
+
+def _parse_cart_key(cart_key, item_data):
+    """Разбирает позицию корзины: (id товара, номенклатура, RAL, id партии).
+
+    Ключ вида "<id>_<ral>_<партия>" даёт id товара, ключ "номенклатура RAL xxxx" -
+    номенклатуру; недостающее из двух равно None.
+    """
+    id_stock = item_data.get('id_stock')
+    id_stock = int(id_stock) if id_stock and str(id_stock).isdigit() else None
+    if cart_key[0].isdigit():
+        return int(cart_key.split('_')[0]), None, item_data.get('ral', ''), id_stock
+    # nomenclature_ral format
+    if ' RAL ' in cart_key:
+        base_nomenclature, ral = cart_key.split(' RAL ', 1)
+    else:
+        base_nomenclature, ral = cart_key, ''
+    return None, base_nomenclature, ral, id_stock
+
+
+def _position_label(product, ral):
+    """Подпись позиции для сообщений: номенклатура и RAL, если его ещё нет в номенклатуре"""
+    if ral and not RAL_IN_NOMENCLATURE.search(product.nomenclature_product):
+        return f"{product.nomenclature_product} RAL {ral}"
+    return product.nomenclature_product
+
+
+def _cart_min_days(item_data):
+    """Минимальный остаток срока годности позиции FEFO в днях; нечисловое - 0"""
+    try:
+        return max(int(item_data.get('min_days') or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _cart_qty(item_data):
+    """Количество позиции корзины; нечисловое - 0"""
+    try:
+        return int(item_data.get('qty', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class OutOfStockError(Exception):
+    """Остатков не хватает на заказ; shortages - [(позиция, запрошено, доступно)]"""
+
+    def __init__(self, shortages):
+        super().__init__(', '.join(f"{label}: запрошено {requested}, доступно {available}"
+                                   for label, requested, available in shortages))
+        self.shortages = shortages
+
+
+def _requested_quantities(quantities):
+    """Пары (id партии, количество) как таблица requested(id_stock, qty) для UPDATE ... FROM.
+
+    В PostgreSQL - VALUES; SQLite не умеет именовать столбцы VALUES в FROM,
+    там те же строки собираются через UNION ALL.
+    """
+    rows = sorted(quantities.items())
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return values(column('id_stock', db.Integer), column('qty', db.Integer), name='requested').data(rows)
+    return union_all(*(select(literal(id_stock).label('id_stock'), literal(qty).label('qty'))
+                       for id_stock, qty in rows)).subquery('requested')
+
+
+def reserve_stocks(quantities):
+    """Списывает остатки партий одним условным UPDATE в текущей транзакции.
+
+    quantities - словарь id партии -> количество. Все партии уменьшаются
+    запросом UPDATE stocks ... FROM (VALUES ...) WHERE count_stock >= qty
+    RETURNING id_stock, поэтому параллельные заказы не могут увести остаток
+    в минус, а число запросов не зависит от размера корзины. Партии заранее
+    блокируются в порядке id (FOR UPDATE), чтобы встречные заказы не
+    взаимоблокировались. Возвращает список партий, которых не хватило:
+    [(id партии, запрошено)].
+    """
+    if not quantities:
+        return []
+    if any(qty <= 0 for qty in quantities.values()):
+        raise ValueError(f"Количество для резерва должно быть положительным: {quantities}")
+    db.session.execute(select(Stock.id_stock)
+                       .where(Stock.id_stock.in_(list(quantities)))
+                       .order_by(Stock.id_stock)
+                       .with_for_update())
+    requested = _requested_quantities(quantities)
+    reserved = set(db.session.execute(
+        update(Stock)
+        .where(Stock.id_stock == requested.c.id_stock, Stock.count_stock >= requested.c.qty)
+        .values(count_stock=Stock.count_stock - requested.c.qty)
+        .returning(Stock.id_stock)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+    return [(id_stock, quantities[id_stock]) for id_stock in sorted(quantities) if id_stock not in reserved]
+
+
+def get_order_by_idempotency_key(user_id, idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.query.filter_by(id_user=user_id, idempotency_key=idempotency_key).first()
+
+
+def create_order(user_id, items, status='pending_moderation', idempotency_key=None):
+    """Создаёт заказ из корзины.
+
+    Товары и партии всех позиций читаются двумя запросами, строки заказа
+    вставляются пакетно, так что число обращений к базе не зависит от
+    размера корзины. Остатки партий резервируются атомарно (reserve_stocks);
+    если какой-то партии не хватает, заказ не создаётся и выбрасывается
+    OutOfStockError. Позиции с allocate='fefo' раскладываются по партиям
+    автоматически (allocate_fefo) и дают несколько строк stock-order; их
+    min_days - фильтр срока годности, с которым позиция добавлена со склада.
+    Цена строки из остатков - цена товара партии; позиция, чья партия
+    относится к другому товару, отбрасывается.
+
+    idempotency_key - ключ отправки формы: повтор с тем же ключом (двойной
+    клик, повтор запроса) возвращает уже созданный заказ.
+    """
+    existing = get_order_by_idempotency_key(user_id, idempotency_key)
+    if existing:
+        return existing
+
+    # Позиции с неположительным количеством в заказ не попадают
+    parsed = [(_parse_cart_key(cart_key, item_data), item_data) for cart_key, item_data in items.items()
+              if _cart_qty(item_data) > 0]
+
+    product_ids = {line[0] for line, _ in parsed if line[0] is not None}
+    nomenclatures = {line[1] for line, _ in parsed if line[1] is not None}
+    stock_ids = {line[3] for line, _ in parsed if line[3] is not None}
+
+    products = Product.query.filter(or_(Product.id_product.in_(product_ids),
+                                        Product.nomenclature_product.in_(nomenclatures))).all()
+    products_by_id = {product.id_product: product for product in products}
+    products_by_nomenclature = {}
+    for product in products:
+        products_by_nomenclature.setdefault(product.nomenclature_product, product)
+    stocks = {}
+    if stock_ids:
+        stocks = {stock.id_stock: stock for stock in
+                  Stock.query.options(joinedload(Stock.product)).filter(Stock.id_stock.in_(stock_ids))}
 
     order_items = {}
-    for cart_key, item_data in items.items():
-        if cart_key[0].isdigit():
-            product_id = int(cart_key.split('_')[0])
-            ral = item_data.get('ral', '')
-            id_stock = item_data.get('id_stock')
+    stock_lines = {}     # id партии -> количество и цена
+    fefo_requests = {}   # (id товара, RAL) -> товар и количество для автоподбора партий
+    for (product_id, base_nomenclature, ral, id_stock), item_data in parsed:
+        if product_id is not None:
+            product = products_by_id.get(product_id)
         else:
-            # nomenclature_ral format
-            if ' RAL ' in cart_key:
-                base_nomenclature, ral = cart_key.split(' RAL ', 1)
-            else:
-                base_nomenclature = cart_key
-                ral = ''
-            product = Product.query.filter_by(nomenclature_product=base_nomenclature).first()
-            if not product:
-                continue
-            product_id = product.id_product
-            id_stock = item_data.get('id_stock')
-
-        # Get product for RAL extraction
-        product = Product.query.get(product_id)
+            product = products_by_nomenclature.get(base_nomenclature)
         if not product:
             continue
+        # Партия должна принадлежать товару позиции: цена строки берётся из товара партии
+        if id_stock and (id_stock not in stocks or stocks[id_stock].id_product != product.id_product):
+            continue
 
         # Extract RAL code if ral is series_info or too long
         if ral and len(ral) > 4:
-            import re
-            ral_match = re.search(r'RAL (\d+)', product.nomenclature_product)
+            ral_match = RAL_IN_NOMENCLATURE.search(product.nomenclature_product)
             ral = ral_match.group(1) if ral_match else ''
-        elif ral and len(ral) > 4:
-            # Truncate if still too long
-            ral = ral[:4]
 
-        key = (product_id, ral, id_stock)
-        if key in order_items:
-            order_items[key]['qty'] += item_data['qty']
-        else:
-            order_items[key] = {'qty': item_data['qty'], 'ral': ral, 'id_stock': id_stock}
-
-    for key, data in order_items.items():
-        product_id, ral, id_stock = key
         if id_stock:
-            so = StockOrder(
-                id_stock=id_stock,
-                id_order=order.id_order,
-                count_order=data['qty']
-            )
-            db.session.add(so)
+            line = stock_lines.setdefault(id_stock, {'qty': 0, 'price': stocks[id_stock].product.price_product})
+            line['qty'] += _cart_qty(item_data)
+        elif item_data.get('allocate') == 'fefo':
+            fefo_request = fefo_requests.setdefault((product.id_product, ral),
+                                                    {'product': product, 'qty': 0, 'min_days': 0})
+            fefo_request['qty'] += _cart_qty(item_data)
+            fefo_request['min_days'] = max(fefo_request['min_days'], _cart_min_days(item_data))
         else:
-            po = ProductOrder(
-                id_product=product_id,
-                id_order=order.id_order,
-                count=data['qty'],
-                ral=ral,
-                creating_date=datetime.utcnow().date()
-            )
-            db.session.add(po)
+            key = (product.id_product, ral)
+            if key in order_items:
+                order_items[key]['qty'] += _cart_qty(item_data)
+            else:
+                order_items[key] = {'qty': _cart_qty(item_data), 'price': product.price_product}
 
-        # Уменьшить остатки в stocks, если товар из остатков
-        if id_stock:
-            stock = Stock.query.get(id_stock)
-            if stock:
-                stock.count_stock -= data['qty']
-                if stock.count_stock < 0:
-                    stock.count_stock = 0
-                db.session.add(stock)
+    order = Order(
+        id_user=user_id,
+        status_order=status,
+        created_at_order=datetime.utcnow().date(),
+        idempotency_key=idempotency_key
+    )
+    db.session.add(order)
+    try:
+        db.session.flush()  # to get order.id_order
+    except IntegrityError:
+        # Параллельный повтор с тем же ключом уже создал заказ
+        db.session.rollback()
+        existing = get_order_by_idempotency_key(user_id, idempotency_key)
+        if existing:
+            return existing
+        raise
+
+    # Зарезервировать остатки выбранных партий (заказ откатится, если чего-то не хватит)
+    shortages = reserve_stocks({id_stock: line['qty'] for id_stock, line in stock_lines.items()})
+    if shortages:
+        db.session.rollback()
+        available = dict(db.session.query(Stock.id_stock, Stock.count_stock)
+                         .filter(Stock.id_stock.in_([id_stock for id_stock, _ in shortages])))
+        raise OutOfStockError([(f"партия п.{id_stock}", qty, available.get(id_stock, 0))
+                               for id_stock, qty in shortages])
+
+    # Автоподбор партий: сначала истекающие раньше (FEFO)
+    fefo_shortages = []
+    for (product_id, ral), fefo_request in fefo_requests.items():
+        product = fefo_request['product']
+        allocations, shortfall = allocate_fefo(product, ral, fefo_request['qty'], fefo_request['min_days'])
+        if shortfall:
+            fefo_shortages.append((_position_label(product, ral), fefo_request['qty'],
+                                   fefo_request['qty'] - shortfall))
+            continue
+        for id_stock, qty in allocations.items():
+            line = stock_lines.setdefault(id_stock, {'qty': 0, 'price': product.price_product})
+            line['qty'] += qty
+    if fefo_shortages:
+        db.session.rollback()
+        raise OutOfStockError(fefo_shortages)
+
+    stock_rows = [{'id_stock': id_stock, 'id_order': order.id_order,
+                   'count_order': line['qty'], 'price_order': line['price']}
+                  for id_stock, line in stock_lines.items()]
+    product_rows = [{'id_product': product_id, 'id_order': order.id_order,
+                     'count': data['qty'], 'ral': ral,
+                     'creating_date': datetime.utcnow().date(), 'price': data['price']}
+                    for (product_id, ral), data in order_items.items()]
+
+    if product_rows:
+        db.session.execute(insert(ProductOrder), product_rows)
+    if stock_rows:
+        db.session.execute(insert(StockOrder), stock_rows)
+        record_movements([{'id_stock': row['id_stock'], 'kind': MOVEMENT_RESERVATION,
+                           'quantity': -row['count_order'], 'id_order': order.id_order}
+                          for row in stock_rows])
+
+    db.session.flush()
+    refresh_order_totals([order.id_order])
+    order.history_version = bump_order_history_version(user_id)
+    total = sum(line['qty'] * line['price'] for line in list(order_items.values()) + list(stock_lines.values()))
+    enqueue_event(EVENT_ORDER_CREATED, {'id_order': order.id_order, 'id_user': user_id,
+                                        'total': float(total)})
 
     db.session.commit()
     return order
 
+def refresh_order_totals(order_ids=None):
+    """Пересчитывает total_amount и line_count заказов одним UPDATE.
+
+    Вызывается после любого изменения строк заказа; без order_ids
+    пересчитывает все заказы (восстановление денормализованных итогов).
+    """
+    production_total = db.session.query(
+        func.coalesce(func.sum(ProductOrder.count * ProductOrder.price), 0)
+    ).filter(ProductOrder.id_order == Order.id_order)\
+     .scalar_subquery()
+
+    stock_total = db.session.query(
+        func.coalesce(func.sum(StockOrder.count_order * StockOrder.price_order), 0)
+    ).filter(StockOrder.id_order == Order.id_order)\
+     .scalar_subquery()
+
+    production_lines = db.session.query(func.count())\
+        .filter(ProductOrder.id_order == Order.id_order)\
+        .scalar_subquery()
+
+    stock_lines = db.session.query(func.count())\
+        .filter(StockOrder.id_order == Order.id_order)\
+        .scalar_subquery()
+
+    query = Order.query
+    if order_ids is not None:
+        query = query.filter(Order.id_order.in_(order_ids))
+    return query.update({
+        Order.total_amount: production_total + stock_total,
+        Order.line_count: production_lines + stock_lines
+    }, synchronize_session=False)
+
+# Строки заказа из остатков в этих статусах держат резерв партии, в этих - отгружены;
+# в остальных (отменён, отклонён) их количество возвращено на склад
+STOCK_RESERVED_STATUSES = ('pending_moderation', 'approved')
+STOCK_SHIPPED_STATUSES = ('completed',)
+
+
+def _stock_state(status):
+    """Вид движения, которым держатся строки заказа в статусе status (None - не держатся)"""
+    if status in STOCK_RESERVED_STATUSES:
+        return MOVEMENT_RESERVATION
+    if status in STOCK_SHIPPED_STATUSES:
+        return MOVEMENT_SHIPMENT
+    return None
+
+
+def apply_order_stock_transitions(transitions, status):
+    """Остатки и журнал движений при смене статуса заказов (без commit).
+
+    transitions - [(id заказа, прежний статус)]. Для строк из остатков
+    сторнируется резерв или отгрузка прежнего статуса и записывается
+    резерв или отгрузка нового: выполнение переводит резерв в отгрузку
+    (count_stock не меняется), отмена и отклонение возвращают количество
+    на склад, возврат отменённого заказа в работу снова списывает партии
+    условным UPDATE. Если партии не хватает, выбрасывается OutOfStockError,
+    и вызывающий должен откатить транзакцию.
+    """
+    new_state = _stock_state(status)
+    old_states = {id_order: _stock_state(old_status) for id_order, old_status in transitions
+                  if _stock_state(old_status) != new_state}
+    if not old_states:
+        return
+
+    lines = db.session.query(StockOrder.id_order, StockOrder.id_stock, StockOrder.count_order)\
+        .filter(StockOrder.id_order.in_(old_states))\
+        .all()
+    movements = []
+    stock_deltas = {}
+    for id_order, id_stock, qty in lines:
+        if not qty:
+            continue
+        old_state = old_states[id_order]
+        if old_state:
+            movements.append({'id_stock': id_stock, 'kind': old_state, 'quantity': qty, 'id_order': id_order})
+        if new_state:
+            movements.append({'id_stock': id_stock, 'kind': new_state, 'quantity': -qty, 'id_order': id_order})
+        delta = (qty if old_state else 0) - (qty if new_state else 0)
+        stock_deltas[id_stock] = stock_deltas.get(id_stock, 0) + delta
+
+    shortages = []
+    for id_stock in sorted(stock_deltas):
+        delta = stock_deltas[id_stock]
+        if delta > 0:
+            db.session.execute(
+                update(Stock)
+                .where(Stock.id_stock == id_stock)
+                .values(count_stock=Stock.count_stock + delta)
+                .execution_options(synchronize_session=False)
+            )
+        elif delta < 0 and not try_reserve_stock(id_stock, -delta):
+            shortages.append((id_stock, -delta))
+    if shortages:
+        available = dict(db.session.query(Stock.id_stock, Stock.count_stock)
+                         .filter(Stock.id_stock.in_([id_stock for id_stock, _ in shortages])))
+        raise OutOfStockError([(f"партия п.{id_stock}", qty, available.get(id_stock, 0))
+                               for id_stock, qty in shortages])
+    record_movements(movements)
+
+
 def update_order_status(order_id, status):
-    order = get_order_by_id(order_id)
+    """Меняет статус заказа, двигая остатки его строк (apply_order_stock_transitions).
+
+    При нехватке остатков транзакция откатывается и выбрасывается OutOfStockError.
+    """
+    order = Order.query.filter_by(id_order=order_id).with_for_update().first()
     if order:
+        if order.status_order != status:
+            try:
+                apply_order_stock_transitions([(order.id_order, order.status_order)], status)
+            except OutOfStockError:
+                db.session.rollback()
+                raise
         order.status_order = status
         order.updated_at_order = datetime.utcnow().date()
+        order.history_version = bump_order_history_version(order.id_user)
+        enqueue_event(EVENT_ORDER_STATUS_CHANGED, {'id_order': order.id_order, 'id_user': order.id_user,
+                                                   'status': status})
         db.session.commit()
     return order
 
+ORDER_STATUSES = ["pending_moderation", "approved", "completed", "cancelled", "rejected"]
+
+
+def bulk_update_order_status(order_ids, status):
+    """Меняет статус списка заказов и двигает остатки их строк.
+
+    Заказы, уже находящиеся в этом статусе, не трогаются. Заказы, которым
+    смена статуса не списывает остатки, меняются одним UPDATE. Возврат
+    отменённых заказов в работу снова резервирует партии, поэтому такие
+    заказы меняются по одному в своём savepoint: заказ, которому не хватило
+    остатков, откатывается, остальные применяются. Возвращает словари
+    id заказа -> результат ('updated', 'unchanged', 'not_found' или
+    'out_of_stock') и id заказа -> текст ошибки для 'out_of_stock'.
+    """
+    order_ids = sorted(set(order_ids))
+    if not order_ids:
+        return {}, {}
+
+    ids_param = bindparam('order_ids', order_ids, type_=ARRAY(db.Integer))
+    # Прежние статусы нужны для движений остатков; заказы блокируются в порядке id
+    changing = db.session.query(Order.id_order, Order.id_user, Order.status_order)\
+        .filter(Order.id_order == any_(ids_param), Order.status_order != status)\
+        .order_by(Order.id_order)\
+        .with_for_update()\
+        .all()
+    new_state = _stock_state(status)
+    reserving = [row for row in changing if new_state and not _stock_state(row.status_order)]
+    plain = [row for row in changing if row not in reserving]
+
+    updated = [(order_id, user_id) for order_id, user_id, _ in plain]
+    if plain:
+        db.session.execute(
+            update(Order)
+            .where(Order.id_order.in_([order_id for order_id, _ in updated]))
+            .values(status_order=status, updated_at_order=datetime.utcnow().date())
+            .execution_options(synchronize_session=False)
+        )
+        apply_order_stock_transitions([(order_id, old_status) for order_id, _, old_status in plain], status)
+
+    errors = {}
+    for order_id, user_id, old_status in reserving:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    update(Order)
+                    .where(Order.id_order == order_id)
+                    .values(status_order=status, updated_at_order=datetime.utcnow().date())
+                    .execution_options(synchronize_session=False)
+                )
+                apply_order_stock_transitions([(order_id, old_status)], status)
+        except OutOfStockError as e:
+            errors[order_id] = str(e)
+            continue
+        updated.append((order_id, user_id))
+
+    results = {order_id: 'not_found' for order_id in order_ids}
+    for order_id, _ in updated:
+        results[order_id] = 'updated'
+    for order_id in errors:
+        results[order_id] = 'out_of_stock'
+
+    rest = [order_id for order_id in order_ids if results[order_id] == 'not_found']
+    if rest:
+        existing = db.session.query(Order.id_order)\
+            .filter(Order.id_order == any_(bindparam('rest_ids', rest, type_=ARRAY(db.Integer))))\
+            .all()
+        for (order_id,) in existing:
+            results[order_id] = 'unchanged'
+
+    versions = bump_order_history_versions(user_id for _, user_id in updated)
+    mark_orders_changed(versions, [order_id for order_id, _ in updated])
+    enqueue_events(EVENT_ORDER_STATUS_CHANGED, [{'id_order': order_id, 'id_user': user_id, 'status': status}
+                                                for order_id, user_id in updated])
+    db.session.commit()
+    return results, errors
+
+
 def get_analyzis_by_stock(stock_id):
     return Analyzis.query.filter_by(id_stock=stock_id).first()
 
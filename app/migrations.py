@@ -0,0 +1,89 @@
+import re
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import text
+from .models import db
+
+# Версионные миграции схемы: migrations/NNNN_описание.sql, применяются по порядку номеров.
+# Миграции пишутся идемпотентно (IF NOT EXISTS), поэтому их можно применить и к базе,
+# созданной из db_primetop.sql.
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+MIGRATION_FILE = re.compile(r'^(\d{4})_[\w-]+\.sql$')
+
+# Миграция с этой строкой выполняется вне транзакции, по одному оператору
+# (нужно для CREATE INDEX CONCURRENTLY)
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+
+# Ключ advisory lock: две одновременные установки не применяют миграции дважды
+MIGRATIONS_LOCK_KEY = 4300431
+
+
+def list_migrations():
+    """Файлы миграций: [(версия, путь)] по возрастанию версии"""
+    migrations = []
+    for path in MIGRATIONS_DIR.glob('*.sql'):
+        match = MIGRATION_FILE.match(path.name)
+        if match:
+            migrations.append((match.group(1), path))
+    return sorted(migrations)
+
+
+def _split_statements(sql):
+    """Разбивает простой SQL-скрипт (без $$-блоков) на отдельные операторы"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def _record_version(conn, version, path):
+    conn.execute(text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+                 {'version': version, 'name': path.name, 'applied_at': datetime.utcnow()})
+
+
+def apply_migration(version, path):
+    """Применяет одну миграцию и записывает её версию в schema_migrations"""
+    sql = path.read_text(encoding='utf-8')
+    if NO_TRANSACTION_MARKER in sql:
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for statement in _split_statements(sql):
+                conn.exec_driver_sql(statement)
+            _record_version(conn, version, path)
+    else:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(sql)
+            _record_version(conn, version, path)
+
+
+def get_applied_versions(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(16) PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    '''))
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def get_pending_migrations():
+    """Ещё не применённые миграции: [(версия, путь)]"""
+    with db.engine.begin() as conn:
+        applied = get_applied_versions(conn)
+    return [(version, path) for version, path in list_migrations() if version not in applied]
+
+
+def migrate():
+    """Применяет все ожидающие миграции по порядку, возвращает их версии.
+
+    На время работы берётся advisory lock, так что параллельный запуск
+    (например, при одновременном деплое нескольких процессов) ждёт первый.
+    """
+    applied = []
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock_conn:
+        lock_conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATIONS_LOCK_KEY})
+        try:
+            for version, path in get_pending_migrations():
+                apply_migration(version, path)
+                applied.append(version)
+        finally:
+            lock_conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATIONS_LOCK_KEY})
+    return applied
@@ -29,6 +29,8 @@ class Product(db.Model):
     img_path_product = db.Column(db.String(255), nullable=True)
     expiration_month_product = db.Column(db.Integer, nullable=False)
     nomenclature_product = db.Column(db.String(255), nullable=False)
+    # Минимальный остаток: ниже него сканер остатков заводит предупреждение
+    reorder_threshold_product = db.Column(db.Integer, nullable=False, default=10)
 
     stocks = db.relationship('Stock', backref='product', lazy=True)
     order_items = db.relationship('ProductOrder', backref='product', lazy=True)
@@ -41,6 +43,8 @@ class Stock(db.Model):
     count_stock = db.Column(db.Integer, nullable=False)
     ral_stock = db.Column(db.String(4), nullable=True)
     date_stock = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
+    # Срок годности: date_stock + expiration_month_product товара, хранится для индекса
+    expires_at_stock = db.Column(db.Date, nullable=False)
 
 class Analyzis(db.Model):
     __tablename__ = 'analyzis'
@@ -74,6 +78,15 @@ class Order(db.Model):
     status_order = db.Column(db.String(255), nullable=False)
     created_at_order = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
     updated_at_order = db.Column(db.Date, nullable=True)
+    # Денормализованные итоги заказа, пересчитываются refresh_order_totals
+    total_amount = db.Column(db.Numeric, nullable=False, default=0)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    # Ключ отправки формы заказа, защищает от повторного создания
+    idempotency_key = db.Column(db.String(64), nullable=True)
+    # Версия истории заказов покупателя, при которой заказ создан или сменил статус
+    history_version = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('id_user', 'idempotency_key', name='orders_idempotency_key_uq'),)
 
     order_items = db.relationship('ProductOrder', backref='order', lazy=True)
     stock_order_items = db.relationship('StockOrder', backref='order', lazy=True)
@@ -85,11 +98,60 @@ class ProductOrder(db.Model):
     count = db.Column(db.Integer, nullable=False)
     ral = db.Column(db.String(4), nullable=True)
     creating_date = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
+    price = db.Column(db.Numeric, nullable=False)  # цена товара на момент заказа
 
 class StockOrder(db.Model):
     __tablename__ = 'stock-order'
     id_stock = db.Column(db.Integer, db.ForeignKey('stocks.id_stock'), primary_key=True)
     id_order = db.Column(db.Integer, db.ForeignKey('orders.id_order'), primary_key=True)
     count_order = db.Column(db.Integer, nullable=True)
+    price_order = db.Column(db.Numeric, nullable=False)  # цена товара на момент заказа
 
     stock = db.relationship('Stock', backref='stock_orders', lazy=True)
+
+class OrderHistoryVersion(db.Model):
+    __tablename__ = 'order_history_versions'
+    id_user = db.Column(db.Integer, db.ForeignKey('users.id_user'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class StockMovement(db.Model):
+    """Движение по партии (журнал только на добавление): приход, резерв, отгрузка, корректировка"""
+    __tablename__ = 'stock_movements'
+    id_movement = db.Column(db.Integer, primary_key=True)
+    id_stock = db.Column(db.Integer, db.ForeignKey('stocks.id_stock'), nullable=False)
+    kind_movement = db.Column(db.String(16), nullable=False)
+    quantity_movement = db.Column(db.Integer, nullable=False)  # со знаком: приход > 0, расход < 0
+    id_order = db.Column(db.Integer, db.ForeignKey('orders.id_order'), nullable=True)
+    note_movement = db.Column(db.Text, nullable=True)
+    created_at_movement = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class StockSnapshot(db.Model):
+    """Остаток партии с учётом всех движений до id_movement включительно"""
+    __tablename__ = 'stock_snapshots'
+    id_stock = db.Column(db.Integer, db.ForeignKey('stocks.id_stock'), primary_key=True)
+    id_movement = db.Column(db.Integer, primary_key=True)
+    balance_snapshot = db.Column(db.Integer, nullable=False)
+    created_at_snapshot = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class OutboxEvent(db.Model):
+    """Событие для фоновой обработки, пишется в одной транзакции с изменением заказа"""
+    __tablename__ = 'outbox_events'
+    id_event = db.Column(db.Integer, primary_key=True)
+    kind_event = db.Column(db.String(64), nullable=False)
+    payload_event = db.Column(db.JSON, nullable=False)
+    created_at_event = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at_event = db.Column(db.DateTime, nullable=True)
+    attempts_event = db.Column(db.Integer, nullable=False, default=0)
+    error_event = db.Column(db.Text, nullable=True)
+
+class StockAlert(db.Model):
+    """Предупреждение сканера остатков: партия с истекающим сроком или товар ниже минимума"""
+    __tablename__ = 'stock_alerts'
+    id_alert = db.Column(db.Integer, primary_key=True)
+    kind_alert = db.Column(db.String(16), nullable=False)
+    id_product = db.Column(db.Integer, db.ForeignKey('products.id_product'), nullable=False)
+    id_stock = db.Column(db.Integer, db.ForeignKey('stocks.id_stock'), nullable=True)
+    quantity_alert = db.Column(db.Integer, nullable=False)
+    threshold_alert = db.Column(db.Integer, nullable=True)
+    expires_at_alert = db.Column(db.Date, nullable=True)
+    scanned_at_alert = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
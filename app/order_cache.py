@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import bindparam, case, text, update
+from .models import db, Order, OrderHistoryVersion
+from .order_projection import get_order_views
+
+# Сколько покупателей держать в кэше истории заказов одного процесса
+ORDER_HISTORY_CACHE_SIZE = 256
+
+_cache = OrderedDict()  # id_user -> (version, orders_data)
+_lock = threading.Lock()
+
+
+def get_order_history_version(user_id):
+    """Текущая версия истории заказов покупателя (общая для всех процессов)"""
+    version = db.session.query(OrderHistoryVersion.version)\
+        .filter(OrderHistoryVersion.id_user == user_id)\
+        .scalar()
+    return version or 0
+
+
+def bump_order_history_version(user_id):
+    """Увеличивает версию истории заказов в текущей транзакции и возвращает её.
+
+    Вызывается при создании заказа и смене его статуса; закэшированные
+    в любых процессах истории этого покупателя становятся неактуальными.
+    """
+    return bump_order_history_versions([user_id]).get(user_id)
+
+
+def bump_order_history_versions(user_ids):
+    """То же для нескольких покупателей сразу: один INSERT ... ON CONFLICT.
+
+    Строка версии создаётся или увеличивается одним оператором, поэтому
+    параллельные транзакции для покупателя без строки не конфликтуют по
+    первичному ключу. Строки берутся в порядке id_user (без взаимоблокировок).
+    Возвращает словарь id покупателя -> новая версия.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return {}
+    rows = db.session.execute(text("""
+        INSERT INTO order_history_versions (id_user, version)
+        SELECT id_user, 1 FROM users WHERE id_user IN :user_ids ORDER BY id_user
+        ON CONFLICT (id_user) DO UPDATE SET version = order_history_versions.version + 1
+        RETURNING id_user, version
+    """).bindparams(bindparam('user_ids', expanding=True)), {'user_ids': user_ids}).all()
+    return dict(rows)
+
+
+def mark_orders_changed(versions, order_ids):
+    """Помечает заказы новой версией истории покупателя (для опроса изменений).
+
+    versions - результат bump_order_history_versions.
+    """
+    if not versions or not order_ids:
+        return
+    version = case(versions, value=Order.id_user)
+    db.session.execute(
+        update(Order)
+        .where(Order.id_order.in_(order_ids))
+        .values(history_version=version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def get_order_history(user_id):
+    """История заказов покупателя из LRU-кэша процесса.
+
+    Возвращает версию и список представлений заказов; при устаревшей версии
+    история перечитывается из базы. Результат нельзя изменять на месте.
+    """
+    version = get_order_history_version(user_id)
+    with _lock:
+        cached = _cache.get(user_id)
+        if cached and cached[0] == version:
+            _cache.move_to_end(user_id)
+            return cached
+
+    orders_data = get_order_views(
+        Order.query.filter_by(id_user=user_id).order_by(Order.created_at_order.desc(), Order.id_order.desc())
+    )
+    with _lock:
+        _cache[user_id] = (version, orders_data)
+        _cache.move_to_end(user_id)
+        while len(_cache) > ORDER_HISTORY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return version, orders_data
+
+
+def get_order_statuses(user_id, since=None):
+    """Статусы заказов покупателя без состава заказов.
+
+    since - версия истории, известная клиенту: тогда только заказы, созданные
+    или сменившие статус после неё (индекс orders_user_history_idx).
+    """
+    query = db.session.query(Order.id_order, Order.status_order)\
+        .filter(Order.id_user == user_id)
+    if since is not None:
+        query = query.filter(Order.history_version > since)
+    return query.all()
@@ -0,0 +1,37 @@
+from .outbox import register_handler, EVENT_ORDER_CREATED, EVENT_ORDER_STATUS_CHANGED
+from .utils import add_message_to_chat
+
+STATUS_NAMES = {
+    "pending_moderation": "На модерации",
+    "approved": "Одобрен",
+    "completed": "Выполнен",
+    "cancelled": "Отменен",
+    "rejected": "Отклонен"
+}
+
+
+def notify_orders_created(payloads):
+    """Сообщение в чат покупателя (его видит менеджер) о новом заказе"""
+    for payload in payloads:
+        add_message_to_chat(
+            payload['id_user'], "bot",
+            f"Заказ №{payload['id_order']} на сумму {payload['total']:.2f} ₽ создан и отправлен на модерацию.",
+            sender_name="Заказы"
+        )
+
+
+def notify_order_status_changes(payloads):
+    """Сообщение в чат покупателя о смене статуса заказа"""
+    for payload in payloads:
+        status = STATUS_NAMES.get(payload['status'], payload['status'])
+        add_message_to_chat(
+            payload['id_user'], "bot",
+            f"Статус заказа №{payload['id_order']} изменен: {status}.",
+            sender_name="Заказы"
+        )
+
+
+def register_order_event_handlers():
+    """Подписывает обработчики событий заказов на outbox"""
+    register_handler(EVENT_ORDER_CREATED, notify_orders_created)
+    register_handler(EVENT_ORDER_STATUS_CHANGED, notify_order_status_changes)
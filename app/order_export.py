@@ -0,0 +1,174 @@
+import csv
+import heapq
+import io
+import tempfile
+from datetime import date
+from sqlalchemy import func, literal, null, select, union_all
+from .models import db, User, Product, Stock, Order, ProductOrder, StockOrder
+
+# Сколько строк читать из серверного курсора за один раз
+EXPORT_BATCH_SIZE = 2000
+
+# XLSX собирается целиком до отправки первого байта, а лист вмещает не больше
+# 1 048 576 строк: большие выгрузки идут только в потоковый CSV
+XLSX_MAX_ROWS = 100_000
+
+EXPORT_COLUMNS = [
+    'Заказ', 'Дата', 'Статус', 'Компания', 'Покупатель',
+    'Тип', 'Номенклатура', 'Товар', 'RAL', 'Партия', 'Количество', 'Цена', 'Сумма'
+]
+
+
+def parse_export_date(value):
+    """Дата фильтра выгрузки в формате YYYY-MM-DD, пустая или битая - None"""
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _filter_lines(stmt, date_from=None, date_to=None, status='', customer=''):
+    """Накладывает фильтры выгрузки на запрос строк заказов"""
+    if date_from:
+        stmt = stmt.where(Order.created_at_order >= date_from)
+    if date_to:
+        stmt = stmt.where(Order.created_at_order <= date_to)
+    if status:
+        stmt = stmt.where(Order.status_order == status)
+    if customer:
+        stmt = stmt.where(User.company_name_user.ilike(f"%{customer}%"))
+    return stmt
+
+
+def export_line_queries(date_from=None, date_to=None, status='', customer=''):
+    """Запросы строк заказов обоих типов (производство, остатки), каждый по порядку id заказа.
+
+    Каждый идёт от orders по первичному ключу, так что упорядочен без
+    сортировки и отдаёт первые строки сразу.
+    """
+    product_lines = select(
+        Order.id_order, Order.created_at_order, Order.status_order,
+        User.company_name_user, User.fullname_user,
+        literal('production').label('line_type'),
+        Product.nomenclature_product, Product.title_product,
+        ProductOrder.ral.label('ral'), null().label('id_stock'),
+        ProductOrder.count.label('qty'), ProductOrder.price.label('price')
+    ).select_from(Order)\
+        .join(User, Order.id_user == User.id_user)\
+        .join(ProductOrder, ProductOrder.id_order == Order.id_order)\
+        .outerjoin(Product, Product.id_product == ProductOrder.id_product)
+
+    stock_lines = select(
+        Order.id_order, Order.created_at_order, Order.status_order,
+        User.company_name_user, User.fullname_user,
+        literal('stock').label('line_type'),
+        Product.nomenclature_product, Product.title_product,
+        Stock.ral_stock.label('ral'), Stock.id_stock.label('id_stock'),
+        StockOrder.count_order.label('qty'), StockOrder.price_order.label('price')
+    ).select_from(Order)\
+        .join(User, Order.id_user == User.id_user)\
+        .join(StockOrder, StockOrder.id_order == Order.id_order)\
+        .join(Stock, Stock.id_stock == StockOrder.id_stock)\
+        .outerjoin(Product, Product.id_product == Stock.id_product)
+
+    filters = dict(date_from=date_from, date_to=date_to, status=status, customer=customer)
+    return [_filter_lines(lines, **filters).order_by(Order.id_order)
+            for lines in (product_lines, stock_lines)]
+
+
+def count_export_lines(**filters):
+    """Число строк выгрузки с теми же фильтрами"""
+    lines = union_all(*(query.order_by(None) for query in export_line_queries(**filters))).subquery()
+    return db.session.execute(select(func.count()).select_from(lines)).scalar()
+
+
+def _stream_lines(query):
+    result = db.session.execute(query, execution_options={'yield_per': EXPORT_BATCH_SIZE})
+    try:
+        yield from result
+    finally:
+        result.close()
+
+
+def iter_export_rows(**filters):
+    """Строки выгрузки по одной, без загрузки всего результата в память.
+
+    Строки обоих типов читаются двумя серверными курсорами (yield_per
+    включает stream_results у psycopg2) и сливаются по id заказа: общий
+    ORDER BY над UNION ALL заставил бы базу отсортировать всю выгрузку до
+    первой строки. У одного заказа строки производства идут раньше строк
+    из остатков. В памяти держится не больше EXPORT_BATCH_SIZE строк на курсор.
+    """
+    streams = [_stream_lines(query) for query in export_line_queries(**filters)]
+    try:
+        for row in heapq.merge(*streams, key=lambda row: row.id_order):
+            qty = row.qty or 0
+            price = row.price or 0
+            yield [
+                row.id_order,
+                row.created_at_order.strftime('%d.%m.%Y') if row.created_at_order else '',
+                row.status_order,
+                row.company_name_user,
+                row.fullname_user,
+                'Производство' if row.line_type == 'production' else 'Остатки',
+                row.nomenclature_product or '',
+                row.title_product or '',
+                row.ral or '',
+                row.id_stock or '',
+                qty,
+                price,
+                qty * price
+            ]
+    finally:
+        for stream in streams:
+            stream.close()
+
+
+def stream_csv(columns, rows):
+    """CSV кусками по EXPORT_BATCH_SIZE строк из итератора rows.
+
+    Разделитель ';' и BOM - чтобы файл корректно открывался в Excel.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if index % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def generate_csv(**filters):
+    """CSV выгрузка заказов"""
+    return stream_csv(EXPORT_COLUMNS, iter_export_rows(**filters))
+
+
+def generate_xlsx(**filters):
+    """XLSX выгрузка заказов.
+
+    Книга пишется в write-only режиме openpyxl (строки сразу уходят во
+    временный файл), затем файл отдаётся кусками. Пока книга собирается,
+    клиент ничего не получает, поэтому вызывающий проверяет
+    count_export_lines против XLSX_MAX_ROWS. Требует openpyxl.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Заказы')
+    sheet.append(EXPORT_COLUMNS)
+    for row in iter_export_rows(**filters):
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as tmp:
+        workbook.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,293 @@
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import and_, case, exists, func, or_, tuple_
+from sqlalchemy.orm import selectinload
+from .models import db, User, Product, Order, ProductOrder, StockOrder, Stock
+from .utils import get_chat_assignments
+
+ORDERS_PER_PAGE = 20
+
+# Порядок статусов при сортировке "по статусу"
+STATUS_RANK = {'pending_moderation': 0, 'approved': 1, 'completed': 2, 'cancelled': 3}
+
+
+def order_loader_options():
+    """Опции загрузки заказа вместе со строками, партиями и товарами.
+
+    Строки подгружаются через selectinload, товары и партии - join'ом к ним,
+    поэтому список заказов любой длины читается за три запроса.
+    """
+    return (
+        selectinload(Order.order_items).joinedload(ProductOrder.product),
+        selectinload(Order.stock_order_items)
+            .joinedload(StockOrder.stock)
+            .joinedload(Stock.product),
+    )
+
+
+def load_orders(query=None):
+    """Загружает заказы запроса с предзагруженным составом"""
+    if query is None:
+        query = Order.query
+    return query.options(*order_loader_options()).all()
+
+
+def project_product_line(item):
+    """Строка заказа на производство (product-order) в виде словаря"""
+    product = item.product
+    title = product.title_product if product else 'Товар не найден'
+    if item.ral:
+        title += f" RAL {item.ral}"
+    return {
+        'product_id': item.id_product,
+        'title': title,
+        'qty': item.count or 0,
+        'price': float(item.price),
+        'ral': item.ral,
+        'type': 'production'
+    }
+
+
+def project_stock_line(item):
+    """Строка заказа из остатков (stock-order) в виде словаря"""
+    stock = item.stock
+    if not stock:
+        return None
+    product = stock.product
+    title = product.nomenclature_product if product else 'Товар'
+    if stock.ral_stock:
+        title += f" RAL {stock.ral_stock}"
+    title += f" (п.{stock.id_stock} от {stock.date_stock.strftime('%d.%m.%Y')})"
+    return {
+        'product_id': stock.id_product,
+        'title': title,
+        'qty': item.count_order or 0,
+        'price': float(item.price_order),
+        'ral': stock.ral_stock,
+        'type': 'stock'
+    }
+
+
+def project_order(order):
+    """Компактное представление заказа для страниц со списками заказов"""
+    items = [project_product_line(item) for item in order.order_items]
+    for item in order.stock_order_items:
+        line = project_stock_line(item)
+        if line:
+            items.append(line)
+
+    return {
+        'id': order.id_order,
+        'user_id': order.id_user,
+        'status': order.status_order,
+        'created_at': order.created_at_order.isoformat() if order.created_at_order else '',
+        'total': float(order.total_amount or 0),
+        'line_count': order.line_count or 0,
+        'items': items
+    }
+
+
+def get_order_views(query=None):
+    """Загружает заказы запроса и возвращает их представления"""
+    return [project_order(order) for order in load_orders(query)]
+
+
+def encode_cursor(values):
+    """Кодирует ключ последней строки страницы в непрозрачный курсор"""
+    values = [v.isoformat() if isinstance(v, date) else str(v) if isinstance(v, Decimal) else v
+              for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Декодирует курсор страницы, для битого курсора возвращает None"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def paginate_keyset(query, sort_keys, descending, cursor, per_page, key_type=None):
+    """Keyset-пагинация запроса по ключу sort_keys (последний ключ - id заказа).
+
+    key_type восстанавливает тип первого ключа из курсора (дата, сумма).
+    Возвращает строки страницы и курсор следующей страницы; значения ключей
+    добавляются в конец каждой строки.
+    """
+    position = decode_cursor(cursor)
+    if position and len(position) != len(sort_keys):
+        position = None
+    if position and key_type:
+        try:
+            position[0] = key_type(position[0])
+        except (ArithmeticError, ValueError, TypeError):
+            position = None
+    if position:
+        boundary = tuple_(*sort_keys)
+        query = query.filter(boundary < tuple_(*position) if descending else boundary > tuple_(*position))
+
+    query = query.add_columns(*sort_keys)\
+        .order_by(*[key.desc() for key in sort_keys] if descending else sort_keys)
+    rows = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(list(rows[-1][-len(sort_keys):]))
+    return rows, next_cursor
+
+
+def _admin_sort_keys(sort_by):
+    """Ключ сортировки списка заказов администратора, направление и тип ключа"""
+    if sort_by == 'customer':
+        return [func.lower(User.company_name_user), Order.id_order], False, None
+    if sort_by == 'status':
+        status_rank = case(STATUS_RANK, value=Order.status_order, else_=len(STATUS_RANK))
+        return [status_rank, Order.id_order], False, None
+    return [Order.created_at_order, Order.id_order], True, date.fromisoformat
+
+
+def _project_customer_rows(rows):
+    """Представления заказов из строк (Order, User, ...) с данными покупателя"""
+    orders_data = []
+    for row in rows:
+        order, user = row[0], row[1]
+        order_dict = project_order(order)
+        order_dict.update({
+            'company_name': user.company_name_user,
+            'customer_name': user.fullname_user
+        })
+        orders_data.append(order_dict)
+    return orders_data
+
+
+def get_admin_orders_page(sort_by='date', filter_customer='', cursor=None, per_page=ORDERS_PER_PAGE):
+    """Страница заказов для администратора с фильтром по компании.
+
+    Фильтр, сортировка и keyset-пагинация выполняются одним запросом, так что
+    стоимость страницы зависит от её размера, а не от всей истории заказов.
+    Возвращает список представлений заказов и курсор следующей страницы.
+    """
+    sort_keys, descending, key_type = _admin_sort_keys(sort_by)
+
+    query = db.session.query(Order, User)\
+        .join(User, Order.id_user == User.id_user)\
+        .options(*order_loader_options())
+
+    if filter_customer:
+        query = query.filter(User.company_name_user.ilike(f"%{filter_customer}%"))
+
+    rows, next_cursor = paginate_keyset(query, sort_keys, descending, cursor, per_page, key_type)
+
+    return _project_customer_rows(rows), next_cursor
+
+
+def _manager_sort_keys(sort_by):
+    """Ключ сортировки списка заказов менеджера, направление и тип ключа"""
+    if sort_by == 'status':
+        return [Order.status_order, Order.id_order], False, None
+    if sort_by == 'total':
+        return [Order.total_amount, Order.id_order], True, Decimal
+    return [Order.created_at_order, Order.id_order], True, date.fromisoformat
+
+
+def get_manager_orders_page(sort_by='date', filter_status='', cursor=None, per_page=ORDERS_PER_PAGE):
+    """Страница заказов для менеджера с фильтром по статусу.
+
+    Сумма заказа хранится в orders.total_amount, поэтому по ней можно
+    сортировать и пагинировать на стороне базы. Возвращает представления
+    заказов и курсор следующей страницы.
+    """
+    sort_keys, descending, key_type = _manager_sort_keys(sort_by)
+
+    query = db.session.query(Order).options(*order_loader_options())
+    if filter_status:
+        query = query.filter(Order.status_order == filter_status)
+
+    rows, next_cursor = paginate_keyset(query, sort_keys, descending, cursor, per_page, key_type)
+
+    orders_data = [project_order(row[0]) for row in rows]
+    return orders_data, next_cursor
+
+
+def _line_search_condition(product='', ral=''):
+    """Условие "в заказе есть строка с этим товаром и RAL" (EXISTS по обеим таблицам строк)"""
+    product_cond = [ProductOrder.id_order == Order.id_order]
+    stock_cond = [StockOrder.id_order == Order.id_order, Stock.id_stock == StockOrder.id_stock]
+    if product:
+        pattern = f"%{product}%"
+        product_cond.append(exists().where(
+            Product.id_product == ProductOrder.id_product,
+            or_(Product.nomenclature_product.ilike(pattern), Product.title_product.ilike(pattern))
+        ))
+        stock_cond.append(exists().where(
+            Product.id_product == Stock.id_product,
+            or_(Product.nomenclature_product.ilike(pattern), Product.title_product.ilike(pattern))
+        ))
+    if ral:
+        product_cond.append(ProductOrder.ral == ral)
+        stock_cond.append(Stock.ral_stock == ral)
+
+    return or_(
+        exists().where(and_(*product_cond)),
+        exists().where(and_(*stock_cond))
+    )
+
+
+def search_orders(company='', product='', ral='', status='', date_from=None, date_to=None,
+                  cursor=None, per_page=ORDERS_PER_PAGE):
+    """Поиск заказов по компании, товару, RAL, статусу и периоду.
+
+    Все условия собираются в один запрос страницы (строки заказа проверяются
+    через EXISTS), индексы pg_trgm/btree из db_primetop.sql делают его
+    дешёвым. Возвращает представления заказов и курсор следующей страницы.
+    """
+    sort_keys, descending, key_type = _admin_sort_keys('date')
+
+    query = db.session.query(Order, User)\
+        .join(User, Order.id_user == User.id_user)\
+        .options(*order_loader_options())
+
+    if company:
+        query = query.filter(User.company_name_user.ilike(f"%{company}%"))
+    if status:
+        query = query.filter(Order.status_order == status)
+    if date_from:
+        query = query.filter(Order.created_at_order >= date_from)
+    if date_to:
+        query = query.filter(Order.created_at_order <= date_to)
+    if product or ral:
+        query = query.filter(_line_search_condition(product, ral))
+
+    rows, next_cursor = paginate_keyset(query, sort_keys, descending, cursor, per_page, key_type)
+
+    return _project_customer_rows(rows), next_cursor
+
+
+def attach_assigned_managers(orders_data):
+    """Добавляет к заказам страницы имя менеджера, назначенного покупателю.
+
+    Назначения читаются из индекса чатов одним чтением, менеджеры - одним
+    запросом к users, вместо чтения чата и поиска менеджера на каждый заказ.
+    """
+    assignments = get_chat_assignments()
+    manager_ids = {}
+    for order_dict in orders_data:
+        manager_id = assignments.get(str(order_dict['user_id']))
+        if manager_id is not None and str(manager_id).isdigit():
+            manager_ids[order_dict['id']] = int(manager_id)
+
+    managers = {}
+    if manager_ids:
+        users = User.query.filter(User.id_user.in_(set(manager_ids.values()))).all()
+        managers = {user.id_user: user.fullname_user for user in users}
+
+    for order_dict in orders_data:
+        manager_id = manager_ids.get(order_dict['id'])
+        order_dict['manager_name'] = managers.get(manager_id, 'Не назначен')
+    return orders_data
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from .models import db, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Виды событий
+EVENT_ORDER_CREATED = 'order_created'
+EVENT_ORDER_STATUS_CHANGED = 'order_status_changed'
+EVENT_STOCK_CHANGED = 'stock_changed'
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_POLL_INTERVAL = 2  # секунды между пустыми опросами
+
+# kind -> список обработчиков; обработчик получает список payload'ов пачки
+_handlers = {}
+
+# kind -> минимальная пауза между обработками (секунды) и время последней
+# обработки в этом процессе (time.monotonic)
+_min_intervals = {}
+_last_processed = {}
+_interval_lock = threading.Lock()
+
+
+def register_handler(kind, handler, min_interval=0):
+    """Подписывает обработчик на события вида kind (повторная подписка игнорируется).
+
+    min_interval - события вида берутся в обработку не чаще раза за столько
+    секунд на процесс; пришедшие за паузу события попадают в одну пачку.
+    """
+    handlers = _handlers.setdefault(kind, [])
+    if handler not in handlers:
+        handlers.append(handler)
+    if min_interval:
+        _min_intervals[kind] = max(_min_intervals.get(kind, 0), min_interval)
+
+
+def _deferred_kinds():
+    """Виды событий, пауза после последней обработки которых ещё не прошла"""
+    now = time.monotonic()
+    with _interval_lock:
+        return [kind for kind, interval in _min_intervals.items()
+                if kind in _last_processed and now - _last_processed[kind] < interval]
+
+
+def enqueue_event(kind, payload):
+    """Добавляет событие в outbox в текущей транзакции (без commit)"""
+    enqueue_events(kind, [payload])
+
+
+def enqueue_events(kind, payloads):
+    """Пакетно добавляет события одного вида в текущей транзакции"""
+    now = datetime.utcnow()
+    rows = [{'kind_event': kind, 'payload_event': payload, 'created_at_event': now, 'attempts_event': 0}
+            for payload in payloads]
+    if rows:
+        db.session.execute(insert(OutboxEvent), rows)
+
+
+def process_outbox_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """Обрабатывает одну пачку необработанных событий.
+
+    События выбираются с FOR UPDATE SKIP LOCKED, поэтому несколько воркеров
+    (потоки, процессы) не мешают друг другу. Обработчики получают все
+    события своего вида из пачки разом. Если обработчик упал, события его
+    вида остаются необработанными и повторяются до OUTBOX_MAX_ATTEMPTS раз
+    (доставка "хотя бы один раз"); их изменения в базе откатываются до
+    savepoint. Виды с непрошедшей паузой min_interval не выбираются вовсе:
+    ждать их внутри транзакции значило бы держать блокировки пачки.
+    Возвращает число выбранных событий.
+    """
+    query = OutboxEvent.query\
+        .filter(OutboxEvent.processed_at_event.is_(None),
+                OutboxEvent.attempts_event < OUTBOX_MAX_ATTEMPTS)
+    deferred = _deferred_kinds()
+    if deferred:
+        query = query.filter(OutboxEvent.kind_event.notin_(deferred))
+    events = query\
+        .order_by(OutboxEvent.id_event)\
+        .limit(batch_size)\
+        .with_for_update(skip_locked=True)\
+        .all()
+    if not events:
+        db.session.commit()
+        return 0
+
+    by_kind = {}
+    for event in events:
+        by_kind.setdefault(event.kind_event, []).append(event)
+
+    now = datetime.utcnow()
+    for kind, kind_events in by_kind.items():
+        try:
+            # Savepoint: ошибка SQL в обработчике не обрывает транзакцию всей пачки
+            with db.session.begin_nested():
+                for handler in _handlers.get(kind, []):
+                    handler([event.payload_event for event in kind_events])
+        except Exception as e:
+            logger.exception(f"Outbox handler for {kind} failed")
+            for event in kind_events:
+                event.attempts_event += 1
+                event.error_event = str(e)
+            continue
+        if kind in _min_intervals:
+            with _interval_lock:
+                _last_processed[kind] = time.monotonic()
+        for event in kind_events:
+            event.attempts_event += 1
+            event.processed_at_event = now
+            event.error_event = None
+
+    db.session.commit()
+    return len(events)
+
+
+def run_outbox_worker(app, stop_event=None, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL):
+    """Цикл воркера: пачки подряд, пока есть события, иначе пауза poll_interval.
+
+    Пауза выдерживается вне транзакции, отложенные по min_interval события
+    заберёт одна из следующих пачек.
+    """
+    while not (stop_event and stop_event.is_set()):
+        with app.app_context():
+            try:
+                processed = process_outbox_batch(batch_size)
+            except Exception:
+                logger.exception("Outbox batch failed")
+                db.session.rollback()
+                processed = 0
+            finally:
+                db.session.remove()
+        if not processed:
+            time.sleep(poll_interval)
+
+
+def start_outbox_worker(app):
+    """Запускает воркер в фоновом потоке текущего процесса"""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_outbox_worker, args=(app, stop_event),
+                              name='outbox-worker', daemon=True)
+    thread.start()
+    return stop_event
@@ -1,6 +1,6 @@
 import os
 import requests
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from ..utils import PRODUCTS, STOCKS, ORDERS, USERS, read_json, write_json, gen_id, get_user_by_username, list_json
 from pathlib import Path
@@ -9,8 +9,15 @@ from ..utils import get_all_chats, get_chat, add_message_to_chat, toggle_bot_for
 from ..chatbot import chatbot
 import hashlib
 from ..models import db, Product, Stock, User, Analyzis, Order
-from ..db_helpers import create_product, update_stock, create_user
-from sqlalchemy import text
+from ..db_helpers import create_product, create_user, stock_expires_at
+from ..order_projection import get_admin_orders_page, attach_assigned_managers
+from ..order_export import parse_export_date, generate_csv, generate_xlsx, count_export_lines, XLSX_MAX_ROWS
+from ..stock_ledger import record_movement, MOVEMENT_RECEIPT
+from ..stock_import import import_stock_file, StockImportError
+from ..stock_overview import get_stock_overview, invalidate_stock_overview
+from ..stock_series import get_stock_series, parse_min_shelf_days
+from ..stock_alerts import get_alert_summary, get_stock_alerts, ALERT_EXPIRED, ALERT_EXPIRING, ALERT_LOW_STOCK
+from sqlalchemy import text, update
 
 bp = Blueprint("admin", __name__, template_folder="../templates")
 
@@ -27,13 +34,17 @@ def admin_index():
     new_orders = Order.query.count()
     products_count = db.session.query(Stock.id_product).distinct().count()
     active_users = User.query.filter(User.role_user == 'buyer').count()
-    low_stock = Stock.query.filter(Stock.count_stock < 10).count()
+    # Складские предупреждения заранее посчитаны сканером (stock_alerts)
+    alert_summary = get_alert_summary()
 
     return render_template("admin_dashboard.html",
                            new_orders=new_orders,
                            products_count=products_count,
                            active_users=active_users,
-                           low_stock=low_stock)
+                           low_stock=alert_summary['counts'][ALERT_LOW_STOCK],
+                           expiring_stock=alert_summary['counts'][ALERT_EXPIRING] + alert_summary['counts'][ALERT_EXPIRED],
+                           alerts_scanned_at=alert_summary['scanned_at'],
+                           stock_alerts=get_stock_alerts())
 
 
 @bp.route("/create_product", methods=["GET", "POST"])
@@ -45,6 +56,7 @@ def create_product_page():
         description = request.form["description"]
         expiration_month = int(request.form["expiration_month"])
         nomenclature = request.form["nomenclature"]
+        reorder_threshold = int(request.form.get("reorder_threshold") or 10)
         # Handle image upload
         img_file = request.files.get("img_file")
         img_path = None
@@ -59,7 +71,8 @@ def create_product_page():
             img_path = f"uploads/{filename}"
 
         # Create product in DB
-        product = create_product(title, price, category, description, img_path, expiration_month, nomenclature)
+        product = create_product(title, price, category, description, img_path, expiration_month, nomenclature,
+                                 reorder_threshold=reorder_threshold)
 
         flash("Товар создан")
         return redirect(url_for("admin.create_product_page"))
@@ -247,116 +260,19 @@ def hash_password(password):
 
 @bp.route("/stocks", methods=["GET", "POST"])
 def stocks():
-    # Получаем данные о сериях товаров напрямую из таблиц stocks и products
-    stock_series = db.session.execute(text("""
-        SELECT
-            CONCAT(p.nomenclature_product,
-                CASE
-                    WHEN s.ral_stock IS NOT NULL THEN CONCAT(' RAL ', s.ral_stock)
-                    ELSE ''
-                END) AS nomenclature_ral,
-            CONCAT('п.', s.id_stock, ' от ', TO_CHAR(s.date_stock, 'DD.MM.YYYY'), ' до ',
-                TO_CHAR(s.date_stock + INTERVAL '1 month' * p.expiration_month_product, 'DD.MM.YYYY')) AS series_info,
-            s.count_stock AS remaining_quantity
-        FROM stocks s
-        JOIN products p ON s.id_product = p.id_product
-        WHERE s.count_stock > 0
-        ORDER BY p.title_product, s.ral_stock, s.date_stock
-    """)).fetchall()
-
-    # Получаем все продукты для формы обновления
-    products = Product.query.all()
-
-    # Подготавливаем данные для шаблона
-    stocks_data = {}
-    total_stock = 0
-    in_stock_count = 0
-    out_of_stock_count = 0
-
-    for product in products:
-        stock = Stock.query.filter_by(id_product=product.id_product).first()
-        stock_qty = stock.count_stock if stock else 0
-        ral = stock.ral_stock if stock else None
-        date = stock.date_stock if stock else None
-        analyzis = None
-        if stock and stock.id_analyzis:
-            analyzis = Analyzis.query.get(stock.id_analyzis)
-
-        # Сохраняем остатки с дополнительными данными
-        stocks_data[product.id_product] = {
-            "qty": stock_qty,
-            "ral": ral,
-            "date": date,
-            "analyzis": analyzis
-        }
-
-        # Добавляем данные к продукту для статистики
-        product.stock_qty = stock_qty
-        product.stock_ral = ral
-        product.analyzis = analyzis
-
-        # Считаем статистику
-        total_stock += stock_qty
-        if stock_qty > 0:
-            in_stock_count += 1
-        else:
-            out_of_stock_count += 1
-
-    # Получаем данные о заказах и их составе
-    orders = Order.query.all()
-    orders_data = []
-    for order in orders:
-        order_dict = {
-            'id': order.id_order,
-            'user_id': order.id_user,
-            'status': order.status_order,
-            'created_at': order.created_at_order.isoformat() if order.created_at_order else '',
-            'total': 0,
-            'items': []
-        }
-        # Handle ProductOrder items
-        for item in order.order_items:
-            product = item.product
-            title = product.title_product
-            if item.ral:
-                title += f" RAL {item.ral}"
-            item_dict = {
-                'product_id': item.id_product,
-                'title': title,
-                'qty': item.count,
-                'price': float(product.price_product) if product else 0,
-                'ral': item.ral
-            }
-            order_dict['items'].append(item_dict)
-            order_dict['total'] += item_dict['qty'] * item_dict['price']
-
-        # Handle StockOrder items
-        for item in order.stock_order_items:
-            stock = item.stock
-            if stock:
-                product = stock.product
-                title = f"{product.nomenclature_product}"
-                if stock.ral_stock:
-                    title += f" RAL {stock.ral_stock}"
-                title += f" (п.{stock.id_stock} от {stock.date_stock.strftime('%d.%m.%Y')})"
-                item_dict = {
-                    'product_id': stock.id_product,
-                    'title': title,
-                    'qty': item.count_order or 0,
-                    'price': float(product.price_product) if product else 0,
-                    'ral': stock.ral_stock
-                }
-                order_dict['items'].append(item_dict)
-                order_dict['total'] += item_dict['qty'] * item_dict['price']
-
-        orders_data.append(order_dict)
-
     if request.method == "POST":
         nomenclature = request.form.get("nomenclature", "").strip()
-        qty = int(request.form.get("qty", 0))
+        try:
+            qty = int(request.form.get("qty", 0))
+        except ValueError:
+            qty = 0
         ral = request.form.get("ral", "").strip() or None
         date_str = request.form.get("date", "").strip()
 
+        if qty <= 0:
+            flash("Количество должно быть больше нуля")
+            return redirect(url_for("admin.stocks"))
+
         if not date_str:
             flash("Дата производства партии обязательна")
             return redirect(url_for("admin.stocks"))
@@ -383,126 +299,135 @@ def stocks():
         ).first()
 
         if existing_stock:
-            # Если запись существует, суммируем количества
-            existing_stock.count_stock += qty
+            # Если запись существует, суммируем количества одним UPDATE: партию
+            # параллельно списывают заказы (try_reserve_stock), чтение-запись потеряло бы изменение
+            db.session.execute(
+                update(Stock)
+                .where(Stock.id_stock == existing_stock.id_stock)
+                .values(count_stock=Stock.count_stock + qty)
+                .execution_options(synchronize_session=False)
+            )
+            record_movement(existing_stock.id_stock, MOVEMENT_RECEIPT, qty)
         else:
             # Создаем новую запись
             new_stock = Stock(
                 id_product=pid,
                 count_stock=qty,
                 ral_stock=ral,
-                date_stock=date_stock
+                date_stock=date_stock,
+                expires_at_stock=stock_expires_at(date_stock, product.expiration_month_product)
             )
             db.session.add(new_stock)
+            db.session.flush()
+            record_movement(new_stock.id_stock, MOVEMENT_RECEIPT, qty)
 
         db.session.commit()
+        invalidate_stock_overview()
         flash("Остаток обновлён")
         return redirect(url_for("admin.stocks"))
 
+    min_shelf_days = parse_min_shelf_days(request.args.get('min_days'))
+    stock_series = get_stock_series(order='title', min_shelf_days=min_shelf_days)
+
+    # Товары с остатками для формы обновления и статистики
+    products, totals = get_stock_overview()
+
     return render_template("admin_stocks.html",
                            products=products,
-                           stocks=stocks_data,
                            stock_series=stock_series,
-                           total_stock=total_stock,
-                           in_stock_count=in_stock_count,
-                           out_of_stock_count=out_of_stock_count,
-                           orders=orders_data)
+                           min_shelf_days=min_shelf_days,
+                           **totals)
 
-@bp.route("/orders")
-def admin_orders():
-    from ..db_helpers import get_all_orders, get_user_by_id
-    from ..utils import get_chat
 
-    orders = get_all_orders()
+@bp.route("/stocks/import", methods=["POST"])
+def import_stocks():
+    """Загрузка остатков из CSV/XLSX; ответ - отчёт об импорте в JSON"""
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        return jsonify({"success": False, "error": "Файл не выбран"})
+    try:
+        report = import_stock_file(upload)
+        invalidate_stock_overview()
+    except StockImportError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e)})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": f"Ошибка импорта: {str(e)}"})
+    return jsonify({"success": True, **report})
+
 
-    # Get sorting and filtering parameters
+@bp.route("/stocks/orders")
+def stocks_orders():
+    """Панель заказов на странице остатков: заказы постранично в JSON"""
+    orders_data, next_cursor = get_admin_orders_page('date', '', request.args.get('cursor'))
+    return jsonify({'orders': orders_data, 'next_cursor': next_cursor})
+
+
+@bp.route("/orders")
+def admin_orders():
+    # Get sorting, filtering and pagination parameters
     sort_by = request.args.get('sort_by', 'date')
     filter_customer = request.args.get('filter_customer', '').strip()
+    cursor = request.args.get('cursor')
+
+    # Filter, sort and paginate in a single SQL query
+    orders_data, next_cursor = get_admin_orders_page(sort_by, filter_customer, cursor)
+
+    # Resolve assigned managers for the whole page at once
+    attach_assigned_managers(orders_data)
+
+    return render_template("admin_orders.html",
+                           orders=orders_data,
+                           sort_by=sort_by,
+                           filter_customer=filter_customer,
+                           cursor=cursor,
+                           next_cursor=next_cursor,
+                           xlsx_max_rows=XLSX_MAX_ROWS)
+
+
+@bp.route("/orders/export")
+def export_orders():
+    """Потоковая выгрузка заказов со строками в CSV или XLSX"""
+    export_format = request.args.get('format', 'csv')
+    filters = dict(
+        date_from=parse_export_date(request.args.get('date_from')),
+        date_to=parse_export_date(request.args.get('date_to')),
+        status=request.args.get('status', ''),
+        customer=request.args.get('customer', '').strip()
+    )
+    filename = f"orders_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
-    # Prepare orders data for template
-    orders_data = []
-    for order in orders:
-        user = get_user_by_id(order.id_user)
-        company_name = user.company_name_user if user else 'N/A'
-        customer_name = user.fullname_user if user else 'N/A'
-
-        # Get assigned manager from chat
-        chat = get_chat(str(order.id_user))
-        manager_name = 'Не назначен'
-        if chat and chat.get('assigned_manager'):
-            manager_user = get_user_by_id(chat['assigned_manager'])
-            if manager_user:
-                manager_name = manager_user.fullname_user
-
-        order_dict = {
-            'id': order.id_order,
-            'user_id': order.id_user,
-            'company_name': company_name,
-            'customer_name': customer_name,
-            'manager_name': manager_name,
-            'status': order.status_order,
-            'created_at': order.created_at_order.isoformat() if order.created_at_order else '',
-            'total': 0,
-            'items': []
-        }
-        # Calculate total and get items from both ProductOrder and StockOrder
-        # Handle ProductOrder items
-        for item in order.order_items:
-            product = item.product
-            title = product.title_product
-            if item.ral:
-                title += f" RAL {item.ral}"
-            item_dict = {
-                'product_id': item.id_product,
-                'title': title,
-                'qty': item.count,
-                'price': float(product.price_product) if product else 0,
-                'ral': item.ral
-            }
-            order_dict['items'].append(item_dict)
-            order_dict['total'] += item_dict['qty'] * item_dict['price']
-
-        # Handle StockOrder items
-        for item in order.stock_order_items:
-            stock = item.stock
-            if stock:
-                product = stock.product
-                title = f"{product.nomenclature_product}"
-                if stock.ral_stock:
-                    title += f" RAL {stock.ral_stock}"
-                title += f" (п.{stock.id_stock} от {stock.date_stock.strftime('%d.%m.%Y')})"
-                item_dict = {
-                    'product_id': stock.id_product,
-                    'title': title,
-                    'qty': item.count_order or 0,
-                    'price': float(product.price_product) if product else 0,
-                    'ral': stock.ral_stock
-                }
-                order_dict['items'].append(item_dict)
-                order_dict['total'] += item_dict['qty'] * item_dict['price']
-
-        orders_data.append(order_dict)
-
-    # Apply filtering
-    if filter_customer:
-        orders_data = [o for o in orders_data if filter_customer.lower() in o['company_name'].lower()]
-
-    # Apply sorting
-    if sort_by == 'date':
-        orders_data.sort(key=lambda x: x['created_at'], reverse=True)
-    elif sort_by == 'customer':
-        orders_data.sort(key=lambda x: x['company_name'].lower())
-    elif sort_by == 'status':
-        status_order = {'pending_moderation': 0, 'approved': 1, 'completed': 2, 'cancelled': 3}
-        orders_data.sort(key=lambda x: status_order.get(x['status'], 4))
-
-    return render_template("admin_orders.html", orders=orders_data, sort_by=sort_by, filter_customer=filter_customer)
+    if export_format == 'xlsx':
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            flash("Для выгрузки в XLSX установите openpyxl")
+            return redirect(url_for("admin.admin_orders"))
+        if count_export_lines(**filters) > XLSX_MAX_ROWS:
+            flash(f"В выгрузке больше {XLSX_MAX_ROWS} строк: выберите CSV или сузьте период")
+            return redirect(url_for("admin.admin_orders"))
+        return Response(
+            stream_with_context(generate_xlsx(**filters)),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            headers={'Content-Disposition': f'attachment; filename={filename}.xlsx'}
+        )
+
+    return Response(
+        stream_with_context(generate_csv(**filters)),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+    )
 
 
 @bp.route("/order/approve/<order_id>")
 def approve_order(order_id):
-    from ..db_helpers import update_order_status
-    order = update_order_status(order_id, "approved")
+    from ..db_helpers import update_order_status, OutOfStockError
+    try:
+        order = update_order_status(order_id, "approved")
+    except OutOfStockError as e:
+        flash(f"Недостаточно остатков: {e}")
+        return redirect(url_for("admin.admin_orders"))
     if not order:
         flash("Заказ не найден")
         return redirect(url_for("admin.admin_orders"))
@@ -1,13 +1,16 @@
 import os
 import requests
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, make_response
-from ..db_helpers import get_all_products, get_all_users, get_all_orders, create_order, get_orders_by_user, get_stock_by_product_id, create_user, verify_user, update_stock, get_user_by_id, get_product_by_id
-from ..models import db, Product
+from ..db_helpers import get_all_products, get_all_users, get_all_orders, create_order, get_orders_by_user, get_stock_by_product_id, create_user, verify_user, get_user_by_id, get_product_by_id, OutOfStockError
+from ..db_helpers import get_order_by_idempotency_key
+from ..stock_series import get_stock_products_page, get_stock_series_item, parse_min_shelf_days
+from ..models import db, Product, Stock
 from datetime import datetime
 from pathlib import Path
 from datetime import datetime
 import re
 import hashlib
+import secrets
 import phonenumbers
 from email_validator import validate_email, EmailNotValidError
 import io
@@ -75,7 +78,7 @@ def generate_invoice(order_id):
     product_orders = ProductOrder.query.filter_by(id_order=order.id_order).all()
     for po in product_orders:
         product = Product.query.get(po.id_product)
-        price = float(product.price_product)
+        price = float(po.price)
         item_total = price * po.count
         total += item_total
 
@@ -92,7 +95,7 @@ def generate_invoice(order_id):
     for so in stock_orders:
         stock = Stock.query.get(so.id_stock)
         product = Product.query.get(stock.id_product)
-        price = float(product.price_product)
+        price = float(so.price_order)
         item_total = price * so.count_order
         total += item_total
 
@@ -583,6 +586,10 @@ def cart():
                     stock = Stock.query.get(id_stock)
                     if stock:
                         stock_info = f"п.{stock.id_stock} от {stock.date_stock.strftime('%d.%m.%Y')}"
+                elif item_data.get('allocate') == 'fefo':
+                    stock_info = "партии подбираются по сроку годности"
+                    if item_data.get('min_days'):
+                        stock_info += f", годные ещё не меньше {item_data['min_days']} дн."
                 item = {
                     "product": product,
                     "product_id": cart_key,
@@ -593,7 +600,7 @@ def cart():
                     "price": price,
                     "sum": price * qty
                 }
-                if id_stock:
+                if id_stock or item_data.get('allocate') == 'fefo':
                     stock_items.append(item)
                 else:
                     production_items.append(item)
@@ -602,7 +609,10 @@ def cart():
             # Skip invalid product IDs
             continue
 
-    return render_template("cart.html", stock_items=stock_items, production_items=production_items, total=total)
+    # Ключ отправки: повторная отправка той же формы не создаст второй заказ
+    checkout_key = secrets.token_urlsafe(16)
+    return render_template("cart.html", stock_items=stock_items, production_items=production_items, total=total,
+                           checkout_key=checkout_key)
 
 
 @bp.route('/create_order', methods=['POST'])
@@ -611,13 +621,26 @@ def create_order_route():
         flash('Пожалуйста, войдите в систему.')
         return redirect(url_for('buyer.login'))
 
+    idempotency_key = request.form.get('idempotency_key') or None
     cart = session.get("cart", {})
     if not cart:
+        # Повторная отправка уже оформленной корзины
+        if get_order_by_idempotency_key(session['user']['id'], idempotency_key):
+            flash('Заказ уже создан.')
+            return redirect(url_for("buyer.orders"))
         flash('Корзина пуста.')
         return redirect(url_for('buyer.cart'))
 
     # Создаем заказ на доставку
-    order_id = create_order(session['user']['id'], cart, status='pending_moderation')
+    try:
+        order_id = create_order(session['user']['id'], cart, status='pending_moderation',
+                                idempotency_key=idempotency_key)
+    except OutOfStockError as e:
+        # Корзина сохраняется, чтобы покупатель мог уменьшить количество
+        flash('Недостаточно товара на складе: ' + '; '.join(
+            f"{label} - запрошено {requested}, доступно {available}"
+            for label, requested, available in e.shortages))
+        return redirect(url_for('buyer.cart'))
     if order_id:
         session['cart'] = {}
         flash('Заказ на доставку создан успешно!')
@@ -634,7 +657,10 @@ def create_production_order():
         return redirect(url_for('buyer.login'))
 
     product_id = request.form.get('product_id')
-    qty = int(request.form.get('qty', 1))
+    try:
+        qty = int(request.form.get('qty', 1))
+    except ValueError:
+        qty = 0
 
     if not product_id:
         flash('Неверный товар.')
@@ -642,7 +668,8 @@ def create_production_order():
 
     # Создаем заказ на производство
     items = {product_id: {'qty': qty, 'ral': ''}}  # Для производства RAL не нужен
-    order_id = create_order(session['user']['id'], items, status='pending_moderation')
+    order_id = create_order(session['user']['id'], items, status='pending_moderation',
+                            idempotency_key=request.form.get('idempotency_key') or None)
     if order_id:
         flash('Заказ на производство создан успешно!')
         return redirect(url_for("buyer.orders"))
@@ -654,19 +681,45 @@ def create_production_order():
 @bp.route('/add_to_cart', methods=['POST'])
 def add_to_cart():
     product_id = request.form.get('product_id')
-    qty = int(request.form.get('qty', 1))
+    try:
+        qty = int(request.form.get('qty', 1))
+    except ValueError:
+        qty = 0
     ral = request.form.get('ral', '')
     id_stock = request.form.get('id_stock')
+    # allocate=fefo - партии подбираются при оформлении, первыми истекающие раньше
+    allocate = request.form.get('allocate') if not id_stock else None
 
     if not product_id:
         flash('Неверный товар.')
         return redirect(url_for('buyer.catalog'))
+    if qty <= 0:
+        flash('Количество должно быть больше нуля.')
+        return redirect(request.referrer or url_for('buyer.catalog'))
+
+    # Партия должна относиться к выбранному товару: по товару партии считается цена
+    if id_stock:
+        stock = Stock.query.get(id_stock) if str(id_stock).isdigit() else None
+        if not stock or str(stock.id_product) != str(product_id):
+            flash('Неверная партия товара.')
+            return redirect(url_for('buyer.stock'))
 
     cart = session.get('cart', {})
-    cart_key = f"{product_id}_{ral}_{id_stock}" if id_stock else (f"{product_id}_{ral}" if ral else product_id)
+    if id_stock:
+        cart_key = f"{product_id}_{ral}_{id_stock}"
+    elif allocate == 'fefo':
+        cart_key = f"{product_id}_{ral}_fefo"
+    else:
+        cart_key = f"{product_id}_{ral}" if ral else product_id
 
     if cart_key not in cart:
         cart[cart_key] = {'qty': 0, 'ral': ral, 'product_id': product_id, 'id_stock': id_stock}
+        if allocate == 'fefo':
+            cart[cart_key]['allocate'] = 'fefo'
+    if allocate == 'fefo':
+        # Подбор берёт только партии, которые покупатель видел с фильтром срока годности
+        min_days = parse_min_shelf_days(request.form.get('min_days'), default=0) or 0
+        cart[cart_key]['min_days'] = max(cart[cart_key].get('min_days', 0), min_days)
     cart[cart_key]['qty'] += qty
     session['cart'] = cart
     session.modified = True
@@ -712,130 +765,55 @@ def orders():
         flash('Пожалуйста, войдите в систему.')
         return redirect(url_for('buyer.login'))
 
-    from ..models import Order, ProductOrder, StockOrder, Product, Stock
-    user_orders = Order.query.filter_by(id_user=session['user']['id']).all()
-
-    orders_data = []
-    for order in user_orders:
-        items = []
-        total = 0
-        # Get ProductOrder items
-        product_orders = ProductOrder.query.filter_by(id_order=order.id_order).all()
-        for po in product_orders:
-            product = Product.query.get(po.id_product)
-            qty = po.count
-            price = float(product.price_product)
-            title = product.title_product
-            if po.ral:
-                title += f" RAL {po.ral}"
-            items.append({
-                'title': title,
-                'price': price,
-                'qty': qty,
-                'product_id': product.id_product,
-                'type': 'production'
-            })
-            total += price * qty
-
-        # Get StockOrder items
-        stock_orders = StockOrder.query.filter_by(id_order=order.id_order).all()
-        for so in stock_orders:
-            stock = Stock.query.get(so.id_stock)
-            product = Product.query.get(stock.id_product)
-            qty = so.count_order
-            price = float(product.price_product)
-            title = f"{product.nomenclature_product}"
-            if stock.ral_stock:
-                title += f" RAL {stock.ral_stock}"
-            title += f" (п.{stock.id_stock} от {stock.date_stock.strftime('%d.%m.%Y')})"
-            items.append({
-                'title': title,
-                'price': price,
-                'qty': qty,
-                'product_id': product.id_product,
-                'type': 'stock'
-            })
-            total += price * qty
-
-        orders_data.append({
-            'id': f"order_{order.id_order}",
-            'created_at': order.created_at_order.isoformat(),
-            'status': order.status_order,
-            'items': items,
-            'total': total
-        })
+    from ..order_cache import get_order_history
+    version, history = get_order_history(session['user']['id'])
+    orders_data = [dict(order_dict, id=f"order_{order_dict['id']}") for order_dict in history]
 
-    return render_template("orders.html", orders=orders_data)
+    return render_template("orders.html", orders=orders_data, orders_version=version)
+
+
+@bp.route("/orders/status")
+def orders_status():
+    """Статусы заказов покупателя, изменившиеся с версии since (для опроса страницей)"""
+    if 'user' not in session:
+        return jsonify({'success': False, 'error': 'Пользователь не авторизован'}), 401
+
+    from ..order_cache import get_order_history_version, get_order_statuses
+    user_id = session['user']['id']
+    version = get_order_history_version(user_id)
+    since = request.args.get('since', type=int)
+    if since == version:
+        return jsonify({'success': True, 'version': version, 'changed': False})
+
+    statuses = get_order_statuses(user_id, since)
+    return jsonify({
+        'success': True,
+        'version': version,
+        'changed': True,
+        'orders': [{'id': f"order_{order_id}", 'status': status} for order_id, status in statuses]
+    })
 
 
 @bp.route("/stock")
 def stock():
-    from sqlalchemy import text
-
-    # Получаем данные напрямую из таблиц stocks и products
-    stock_series = db.session.execute(text("""
-        SELECT s.id_stock,
-               concat(p.nomenclature_product,
-                      CASE WHEN s.ral_stock IS NOT NULL THEN concat(' RAL ', s.ral_stock) ELSE '' END) AS nomenclature_ral,
-               concat('п.', s.id_stock, ' от ', to_char(s.date_stock, 'DD.MM.YYYY'), ' до ',
-                      to_char(s.date_stock + (p.expiration_month_product || ' months')::interval, 'DD.MM.YYYY')) AS series_info,
-               s.count_stock AS remaining_quantity
-        FROM stocks s
-        JOIN products p ON s.id_product = p.id_product
-        WHERE s.count_stock > 0
-        ORDER BY nomenclature_ral, series_info
-    """)).fetchall()
-
-    # Получаем все продукты для сопоставления названий
-    products = get_all_products()
-    product_names = {p.nomenclature_product: p.title_product for p in products}
-    product_ids = {p.nomenclature_product: p.id_product for p in products}
-
-    # Подготавливаем данные для шаблона
-    stock_data = []
-    for series in stock_series:
-        # Извлекаем базовую номенклатуру из nomenclature_ral
-        if ' RAL ' in series.nomenclature_ral:
-            base_nomenclature = series.nomenclature_ral.split(' RAL ')[0]
-        else:
-            base_nomenclature = series.nomenclature_ral
-
-        product_name = product_names.get(base_nomenclature, series.nomenclature_ral)
-        product_id = product_ids.get(base_nomenclature)
-        if product_id is not None:
-            try:
-                product_id = int(product_id)
-                stock_data.append({
-                    'product_name': product_name,
-                    'nomenclature_ral': series.nomenclature_ral,
-                    'series_info': series.series_info,
-                    'remaining_quantity': series.remaining_quantity,
-                    'product_id': product_id,
-                    'id_stock': series.id_stock
-                })
-            except (ValueError, TypeError):
-                continue  # Skip invalid product IDs
+    # Партии в наличии из материализованного представления product_stock_series,
+    # по товарам постранично; просроченные партии покупателю не показываются
+    min_shelf_days = parse_min_shelf_days(request.args.get('min_days'), default=0) or 0
+    search = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor')
+    stock_groups, next_cursor = get_stock_products_page(cursor, min_shelf_days=min_shelf_days, search=search)
 
-    return render_template("stock.html", stock_data=stock_data)
+    return render_template("stock.html",
+                           stock_groups=stock_groups,
+                           cursor=cursor,
+                           next_cursor=next_cursor,
+                           min_shelf_days=min_shelf_days,
+                           search=search)
 
 
 @bp.route("/stock_detail/<int:id_stock>/")
 def stock_detail(id_stock):
-    # Получить информацию о остатке по id_stock напрямую из таблиц stocks и products
-    from sqlalchemy import text
-    stock_series = db.session.execute(text("""
-        SELECT s.id_stock,
-               concat(p.nomenclature_product,
-                      CASE WHEN s.ral_stock IS NOT NULL THEN concat(' RAL ', s.ral_stock) ELSE '' END) AS nomenclature_ral,
-               concat('п.', s.id_stock, ' от ', to_char(s.date_stock, 'DD.MM.YYYY'), ' до ',
-                      to_char(s.date_stock + (p.expiration_month_product || ' months')::interval, 'DD.MM.YYYY')) AS series_info,
-               s.count_stock AS remaining_quantity,
-               p.id_product, p.title_product, p.description_product, p.price_product, p.img_path_product
-        FROM stocks s
-        JOIN products p ON s.id_product = p.id_product
-        WHERE s.id_stock = :id_stock
-        LIMIT 1
-    """), {'id_stock': id_stock}).fetchone()
+    stock_series = get_stock_series_item(id_stock)
 
     if not stock_series:
         flash('Информация о остатке не найдена.')
@@ -849,7 +827,7 @@ def stock_detail(id_stock):
         description_product=stock_series.description_product,
         price_product=stock_series.price_product,
         img_path_product=stock_series.img_path_product,
-        nomenclature_product=stock_series.nomenclature_ral.split(' RAL ')[0] if ' RAL ' in stock_series.nomenclature_ral else stock_series.nomenclature_ral,
+        nomenclature_product=stock_series.nomenclature_product,
         category_product='',  # Не используется в шаблоне
         expiration_month_product=0,  # Не используется в шаблоне
         created_at_product=None  # Не используется в шаблоне
@@ -857,7 +835,9 @@ def stock_detail(id_stock):
 
     stock_info = {
         'nomenclature_ral': stock_series.nomenclature_ral,
-        'series_info': stock_series.series_info,
+        'ral': stock_series.ral_stock,
+        'date_stock': stock_series.date_stock,
+        'expires_at_stock': stock_series.expires_at_stock,
         'remaining_quantity': stock_series.remaining_quantity,
         'id_stock': stock_series.id_stock
     }
@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context
 from ..db_helpers import get_all_users, get_all_products, get_orders_by_user, get_all_orders, update_order_status
-from ..models import db, Product, Stock
-from sqlalchemy import text
+from ..db_helpers import bulk_update_order_status, ORDER_STATUSES, update_product_stock_expiry, OutOfStockError
+from ..models import db, Product
+from ..order_projection import get_manager_orders_page, search_orders
+from ..order_export import parse_export_date
+from ..stock_overview import get_stock_overview
+from ..stock_series import get_stock_series, mark_stock_changed, parse_min_shelf_days
+from ..stock_alerts import get_alert_summary, ALERT_EXPIRED, ALERT_EXPIRING, ALERT_LOW_STOCK
+from ..stock_recall import get_recall_report, generate_recall_csv, parse_recall_id
 import os
 from werkzeug.utils import secure_filename
 from datetime import datetime
@@ -21,114 +27,38 @@ def check_manager():
 
 @bp.route("/")
 def manager_index():
-    return render_template("manager_dashboard.html")
+    alert_summary = get_alert_summary()
+    return render_template("manager_dashboard.html",
+                           low_stock=alert_summary['counts'][ALERT_LOW_STOCK],
+                           expiring_stock=alert_summary['counts'][ALERT_EXPIRING] + alert_summary['counts'][ALERT_EXPIRED])
 
 
 @bp.route("/orders")
 def orders():
     """Страница управления заказами для менеджера с фильтрацией"""
-    # Получаем параметры фильтрации
+    # Получаем параметры фильтрации и пагинации
     sort_by = request.args.get('sort_by', 'date')
     filter_status = request.args.get('filter_status', '')
+    cursor = request.args.get('cursor')
 
-    # Получаем все заказы
-    orders = get_all_orders()
-
-    # Применяем фильтрацию по статусу
-    if filter_status:
-        orders = [o for o in orders if o.status_order == filter_status]
-
-    # Сортируем заказы
-    if sort_by == 'date':
-        orders.sort(key=lambda x: x.created_at_order or datetime.min, reverse=True)
-    elif sort_by == 'status':
-        orders.sort(key=lambda x: x.status_order)
-    elif sort_by == 'total':
-        # Здесь нужно будет добавить расчет общей суммы заказа
-        pass
-
-    # Подготавливаем данные для шаблона (аналогично предыдущей версии)
-    orders_data = []
-    for order in orders:
-        order_dict = {
-            'id': order.id_order,
-            'user_id': order.id_user,
-            'status': order.status_order,
-            'created_at': order.created_at_order.isoformat() if order.created_at_order else '',
-            'total': 0,
-            'items': []
-        }
-
-        # Получаем товары из ProductOrder
-        try:
-            if hasattr(order, 'order_items'):
-                product_items = list(order.order_items)  # Преобразуем в список
-
-                for item in product_items:
-                    product = getattr(item, 'product', None)
-                    title = getattr(product, 'title_product', 'Товар не найден') if product else 'Товар не найден'
-                    ral = getattr(item, 'ral', None)
-
-                    if ral:
-                        title += f" RAL {ral}"
-
-                    item_dict = {
-                        'product_id': getattr(item, 'id_product', 0),
-                        'title': title,
-                        'qty': getattr(item, 'count', 0),
-                        'price': float(getattr(product, 'price_product', 0)) if product else 0,
-                        'ral': ral
-                    }
-                    order_dict['items'].append(item_dict)
-                    order_dict['total'] += item_dict['qty'] * item_dict['price']
-            else:
-                print("  No order_items attribute")
-        except Exception as e:
-            print(f"  Error processing product items: {e}")
-
-        # Получаем товары из StockOrder
-        try:
-            if hasattr(order, 'stock_order_items'):
-                stock_items = list(order.stock_order_items)  # Преобразуем в список
-
-                for item in stock_items:
-                    stock = getattr(item, 'stock', None)
-                    if stock:
-                        product = getattr(stock, 'product', None)
-                        title = getattr(product, 'nomenclature_product', 'Товар') if product else 'Товар'
-                        ral = getattr(stock, 'ral_stock', None)
-                        date_stock = getattr(stock, 'date_stock', None)
-
-                        if ral:
-                            title += f" RAL {ral}"
-                        if date_stock:
-                            title += f" (п.{getattr(stock, 'id_stock', '')} от {date_stock.strftime('%d.%m.%Y')})"
-
-                        item_dict = {
-                            'product_id': getattr(stock, 'id_product', 0),
-                            'title': title,
-                            'qty': getattr(item, 'count_order', 0) or 0,
-                            'price': float(getattr(product, 'price_product', 0)) if product else 0,
-                            'ral': ral
-                        }
-                        order_dict['items'].append(item_dict)
-                        order_dict['total'] += item_dict['qty'] * item_dict['price']
-            else:
-                print("  No stock_order_items attribute")
-        except Exception as e:
-            print(f"  Error processing stock items: {e}")
-
+    # Фильтрация, сортировка (в т.ч. по сумме) и пагинация выполняются в SQL
+    orders_data, next_cursor = get_manager_orders_page(sort_by, filter_status, cursor)
 
-        orders_data.append(order_dict)
     return render_template("manager_orders.html",
                            orders=orders_data,
                            sort_by=sort_by,
-                           filter_status=filter_status)
+                           filter_status=filter_status,
+                           cursor=cursor,
+                           next_cursor=next_cursor)
 
 @bp.route("/order/approve/<order_id>")
 def approve_order(order_id):
     """Одобрение заказа"""
-    order = update_order_status(order_id, "approved")
+    try:
+        order = update_order_status(order_id, "approved")
+    except OutOfStockError as e:
+        flash(f"Недостаточно остатков: {e}")
+        return redirect(url_for("manager.orders"))
     if not order:
         flash("Заказ не найден")
         return redirect(url_for("manager.orders"))
@@ -147,44 +77,84 @@ def reject_order(order_id):
     return redirect(url_for("manager.orders"))
 
 
-@bp.route("/stocks")
-def stocks():
-    """Страница управления остатками для менеджера"""
-    # Получаем данные из представления product_stock_series
-    stock_series = db.session.execute(text("""
-        SELECT nomenclature_ral, series_info, remaining_quantity
-        FROM product_stock_series
-        ORDER BY nomenclature_ral, series_info
-    """)).fetchall()
-
-    # Получаем все продукты
-    products = get_all_products()
+@bp.route("/orders/search")
+def search_orders_route():
+    """Поиск заказов по компании, товару, RAL, статусу и периоду (JSON, постранично)"""
+    orders_data, next_cursor = search_orders(
+        company=request.args.get('company', '').strip(),
+        product=request.args.get('product', '').strip(),
+        ral=request.args.get('ral', '').strip(),
+        status=request.args.get('status', ''),
+        date_from=parse_export_date(request.args.get('date_from')),
+        date_to=parse_export_date(request.args.get('date_to')),
+        cursor=request.args.get('cursor')
+    )
+    return jsonify({'orders': orders_data, 'next_cursor': next_cursor})
+
+
+# Действия массовой модерации и соответствующие им статусы
+BULK_ACTIONS = {"approve": "approved", "reject": "rejected"}
+BULK_ORDERS_LIMIT = 1000
+
+
+@bp.route("/orders/bulk_status", methods=["POST"])
+def bulk_order_status():
+    """Массовая смена статуса заказов одной транзакцией.
+
+    Принимает JSON {"order_ids": [...], "action": "approve"|"reject"} или
+    {"order_ids": [...], "status": "..."}; возвращает результат по каждому заказу.
+    Заказ, которому не хватило остатков, пропускается (out_of_stock), остальные применяются.
+    """
+    data = request.get_json(silent=True) or {}
+    status = BULK_ACTIONS.get(data.get("action"), data.get("status"))
+    if status not in ORDER_STATUSES:
+        return jsonify({"success": False, "error": "Неверный статус"}), 400
+
+    raw_ids = data.get("order_ids")
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return jsonify({"success": False, "error": "Не выбраны заказы"}), 400
+    if len(raw_ids) > BULK_ORDERS_LIMIT:
+        return jsonify({"success": False, "error": f"Не больше {BULK_ORDERS_LIMIT} заказов за раз"}), 400
+
+    order_ids, results = [], []
+    for raw_id in raw_ids:
+        if str(raw_id).isdigit():
+            order_ids.append(int(raw_id))
+        else:
+            results.append({"id": raw_id, "result": "invalid_id"})
 
-    # Подготавливаем данные для шаблона
-    total_stock = 0
-    in_stock_count = 0
-    out_of_stock_count = 0
+    try:
+        updated, errors = bulk_update_order_status(order_ids, status)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    for order_id, result in updated.items():
+        item = {"id": order_id, "result": result}
+        if order_id in errors:
+            item["error"] = f"Недостаточно остатков: {errors[order_id]}"
+        results.append(item)
+    return jsonify({
+        "success": True,
+        "status": status,
+        "updated": sum(1 for result in updated.values() if result == "updated"),
+        "results": results
+    })
 
-    for product in products:
-        stock = Stock.query.filter_by(id_product=product.id_product).first()
-        stock_qty = stock.count_stock if stock else 0
 
-        # Добавляем данные к продукту для статистики
-        product.stock_qty = stock_qty
+@bp.route("/stocks")
+def stocks():
+    """Страница управления остатками для менеджера"""
+    min_shelf_days = parse_min_shelf_days(request.args.get('min_days'))
+    stock_series = get_stock_series(min_shelf_days=min_shelf_days)
 
-        # Считаем статистику
-        total_stock += stock_qty
-        if stock_qty > 0:
-            in_stock_count += 1
-        else:
-            out_of_stock_count += 1
+    products, totals = get_stock_overview()
 
     return render_template("manager_stocks.html",
                            products=products,
                            stock_series=stock_series,
-                           total_stock=total_stock,
-                           in_stock_count=in_stock_count,
-                           out_of_stock_count=out_of_stock_count)
+                           min_shelf_days=min_shelf_days,
+                           **totals)
 
 
 @bp.route("/products")
@@ -208,8 +178,11 @@ def edit_product(product_id):
             product.price_product = float(request.form.get("price", 0))
             product.category_product = request.form["category"]
             product.description_product = request.form["description"]
-            product.expiration_month_product = int(request.form["expiration_month"])
             product.nomenclature_product = request.form["nomenclature"]
+            expiration_month = int(request.form["expiration_month"])
+            if expiration_month != product.expiration_month_product:
+                product.expiration_month_product = expiration_month
+                update_product_stock_expiry(product)
 
             # Handle image upload
             img_file = request.files.get("img_file")
@@ -223,6 +196,8 @@ def edit_product(product_id):
                 img_file.save(os.path.join(uploads_dir, filename))
                 product.img_product = f"uploads/{filename}"
 
+            # Номенклатура и название товара входят в подписи партий
+            mark_stock_changed()
             db.session.commit()
             flash("Товар успешно обновлен")
             return redirect(url_for("manager.products"))
@@ -389,6 +364,34 @@ def reports():
                            pending_orders=pending_orders)
 
 
+def _recall_filters():
+    return dict(
+        id_stock=parse_recall_id(request.args.get('id_stock')),
+        id_analyzis=parse_recall_id(request.args.get('id_analyzis')),
+        email=request.args.get('email', '').strip()
+    )
+
+
+@bp.route("/recall")
+def recall():
+    """Отчёт для отзыва: партия -> заказы -> покупатели и покупатель -> партии"""
+    filters = _recall_filters()
+    report = get_recall_report(**filters)
+    return render_template("manager_recall.html", report=report, **filters)
+
+
+@bp.route("/recall/export")
+def export_recall():
+    """Потоковая выгрузка отчёта для отзыва в CSV"""
+    filters = _recall_filters()
+    filename = f"recall_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return Response(
+        stream_with_context(generate_recall_csv(**filters)),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+    )
+
+
 @bp.route("/select_customer", methods=["GET", "POST"])
 def select_customer():
     customers = [u for u in get_all_users() if u.role_user == "buyer"]
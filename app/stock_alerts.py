@@ -0,0 +1,128 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, delete, func, insert, literal, null, select, text
+from .models import db, Product, Stock, StockAlert
+
+logger = logging.getLogger(__name__)
+
+# Виды предупреждений
+ALERT_EXPIRED = 'expired'        # партия в наличии, срок годности вышел
+ALERT_EXPIRING = 'expiring'      # срок годности выходит в ближайшие EXPIRY_ALERT_DAYS дней
+ALERT_LOW_STOCK = 'low_stock'    # годный остаток товара ниже reorder_threshold_product
+ALERT_KINDS = (ALERT_EXPIRED, ALERT_EXPIRING, ALERT_LOW_STOCK)
+
+EXPIRY_ALERT_DAYS = 30
+SCAN_INTERVAL = 15 * 60  # секунды между проходами сканера
+
+# Ключ advisory lock: параллельные проходы сканера не дублируют предупреждения
+SCAN_LOCK_KEY = 4800481
+
+ALERT_COLUMNS = ['kind_alert', 'id_product', 'id_stock', 'quantity_alert',
+                 'threshold_alert', 'expires_at_alert', 'scanned_at_alert']
+
+
+def _lock_scan():
+    # SQLite пропускает писателей по одному, блокировка там не нужна
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCAN_LOCK_KEY})
+
+
+def scan_stock_alerts(expiry_days=EXPIRY_ALERT_DAYS, today=None):
+    """Пересчитывает таблицу stock_alerts и фиксирует транзакцию.
+
+    Партии с истекшим или истекающим сроком выбираются по индексу
+    stocks_expires_idx, годный остаток товаров считается одним GROUP BY.
+    Нехватка ищется только у товаров, у которых были партии: товары под
+    заказ без остатков на складе не предупреждаются.
+    Старые предупреждения заменяются в той же транзакции, поэтому панели
+    всегда видят полный результат одного прохода. Возвращает число
+    предупреждений по видам.
+    """
+    today = today or date.today()
+    now = datetime.utcnow()
+    _lock_scan()
+    db.session.execute(delete(StockAlert))
+
+    expiring = select(
+        case((Stock.expires_at_stock < today, ALERT_EXPIRED), else_=ALERT_EXPIRING),
+        Stock.id_product, Stock.id_stock, Stock.count_stock, null(), Stock.expires_at_stock, literal(now)
+    ).where(Stock.count_stock > 0,
+            Stock.expires_at_stock < today + timedelta(days=expiry_days))
+    db.session.execute(insert(StockAlert).from_select(ALERT_COLUMNS, expiring))
+
+    usable = select(Stock.id_product, func.sum(Stock.count_stock).label('qty'))\
+        .where(Stock.count_stock > 0, Stock.expires_at_stock >= today)\
+        .group_by(Stock.id_product)\
+        .subquery()
+    qty = func.coalesce(usable.c.qty, 0)
+    low_stock = select(
+        literal(ALERT_LOW_STOCK), Product.id_product, null(), qty,
+        Product.reorder_threshold_product, null(), literal(now)
+    ).outerjoin(usable, usable.c.id_product == Product.id_product)\
+        .where(qty < Product.reorder_threshold_product,
+               select(Stock.id_stock).where(Stock.id_product == Product.id_product).exists())
+    db.session.execute(insert(StockAlert).from_select(ALERT_COLUMNS, low_stock))
+
+    db.session.commit()
+    return get_alert_summary()['counts']
+
+
+def get_alert_summary():
+    """Число предупреждений по видам и время последнего прохода сканера"""
+    rows = db.session.query(StockAlert.kind_alert, func.count(StockAlert.id_alert),
+                            func.max(StockAlert.scanned_at_alert))\
+        .group_by(StockAlert.kind_alert)\
+        .all()
+    counts = dict.fromkeys(ALERT_KINDS, 0)
+    counts.update({kind: count for kind, count, _ in rows})
+    scanned_at = max((scanned for _, _, scanned in rows), default=None)
+    return {'counts': counts, 'scanned_at': scanned_at}
+
+
+def get_stock_alerts(limit=20):
+    """Предупреждения для панели: просроченные, истекающие, затем нехватка товара"""
+    order = case({ALERT_EXPIRED: 0, ALERT_EXPIRING: 1}, value=StockAlert.kind_alert, else_=2)
+    rows = db.session.query(StockAlert, Product.title_product, Product.nomenclature_product, Stock.ral_stock)\
+        .join(Product, Product.id_product == StockAlert.id_product)\
+        .outerjoin(Stock, Stock.id_stock == StockAlert.id_stock)\
+        .order_by(order, StockAlert.expires_at_alert, StockAlert.quantity_alert)\
+        .limit(limit)\
+        .all()
+    return [{
+        'kind': alert.kind_alert,
+        'id_product': alert.id_product,
+        'id_stock': alert.id_stock,
+        'title': title,
+        'nomenclature': nomenclature,
+        'ral': ral,
+        'quantity': alert.quantity_alert,
+        'threshold': alert.threshold_alert,
+        'expires_at': alert.expires_at_alert
+    } for alert, title, nomenclature, ral in rows]
+
+
+def run_stock_alert_scanner(app, stop_event=None, interval=SCAN_INTERVAL):
+    """Цикл сканера: проход, затем пауза interval (stop_event прерывает паузу)"""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        with app.app_context():
+            try:
+                counts = scan_stock_alerts()
+                logger.info(f"Stock alerts: {counts}")
+            except Exception:
+                logger.exception("Stock alert scan failed")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+        stop_event.wait(interval)
+
+
+def start_stock_alert_scanner(app):
+    """Запускает сканер в фоновом потоке текущего процесса"""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_stock_alert_scanner, args=(app, stop_event),
+                              name='stock-alert-scanner', daemon=True)
+    thread.start()
+    return stop_event
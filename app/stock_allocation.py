@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+from sqlalchemy import func, select, update
+from .models import db, Stock
+
+# Сколько раз пересчитывать план, если партию успел забрать параллельный заказ
+FEFO_ATTEMPTS = 3
+
+
+def try_reserve_stock(id_stock, qty):
+    """Условно списывает qty с партии: UPDATE ... WHERE count_stock >= :qty.
+
+    Возвращает True, если остатка хватило и партия уменьшена. qty должно
+    быть положительным: отрицательное списание увеличило бы остаток.
+    """
+    if qty <= 0:
+        raise ValueError(f"Количество для резерва должно быть положительным: {qty}")
+    result = db.session.execute(
+        update(Stock)
+        .where(Stock.id_stock == id_stock, Stock.count_stock >= qty)
+        .values(count_stock=Stock.count_stock - qty)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def plan_fefo(product, ral, qty, min_days=0, today=None):
+    """План списания qty товара с RAL по партиям, первыми - истекающие раньше.
+
+    Партии упорядочены по хранимому сроку годности expires_at_stock, затем
+    по date_stock и id (индекс stocks_fefo_expiry_idx). Просроченные партии
+    и партии, годные меньше min_days дней (фильтр страницы склада), пропускаются. Накопительная сумма остатков (оконная функция) отсекает
+    партии, которые уже не нужны, так что план считается одним запросом.
+    Возвращает [(id партии, количество)].
+    """
+    fefo_order = (Stock.expires_at_stock.asc().nulls_last(), Stock.date_stock, Stock.id_stock)
+    running_before = func.sum(Stock.count_stock).over(order_by=fefo_order) - Stock.count_stock
+
+    candidates = select(Stock.id_stock, Stock.count_stock, Stock.expires_at_stock, Stock.date_stock,
+                        running_before.label('before'))\
+        .where(Stock.id_product == product.id_product,
+               Stock.ral_stock == ral if ral else Stock.ral_stock.is_(None),
+               Stock.expires_at_stock >= (today or date.today()) + timedelta(days=min_days),
+               Stock.count_stock > 0)\
+        .subquery()
+
+    rows = db.session.execute(
+        select(candidates.c.id_stock, candidates.c.count_stock, candidates.c.before)
+        .where(candidates.c.before < qty)
+        .order_by(candidates.c.expires_at_stock.asc().nulls_last(), candidates.c.date_stock, candidates.c.id_stock)
+    ).all()
+    return [(id_stock, min(count_stock, qty - before)) for id_stock, count_stock, before in rows]
+
+
+def allocate_fefo(product, ral, qty, min_days=0):
+    """Резервирует qty товара по плану FEFO в текущей транзакции.
+
+    min_days - брать только партии, годные ещё не меньше стольких дней.
+
+    Каждая партия списывается условным UPDATE; если партию успел уменьшить
+    параллельный заказ, план пересчитывается для оставшегося количества.
+    Возвращает словарь id партии -> количество и недостачу (0, если хватило;
+    иначе - сколько не хватает сверх доступного остатка).
+    """
+    allocations = {}
+    remaining = qty
+    for _ in range(FEFO_ATTEMPTS):
+        plan = plan_fefo(product, ral, remaining, min_days)
+        planned = sum(take for _, take in plan)
+        if planned < remaining:
+            return allocations, remaining - planned
+        for id_stock, take in plan:
+            if try_reserve_stock(id_stock, take):
+                allocations[id_stock] = allocations.get(id_stock, 0) + take
+                remaining -= take
+        if not remaining:
+            break
+    return allocations, remaining
@@ -0,0 +1,221 @@
+import csv
+import io
+import tempfile
+from datetime import date, datetime
+from sqlalchemy import text
+from .models import db
+from .stock_ledger import MOVEMENT_RECEIPT, lock_movement_writes
+from .stock_series import mark_stock_changed
+
+# Заголовки столбцов файла (в нижнем регистре) -> поле строки импорта
+IMPORT_COLUMNS = {
+    'nomenclature': 'nomenclature', 'номенклатура': 'nomenclature',
+    'ral': 'ral',
+    'date': 'date', 'дата': 'date', 'дата производства': 'date',
+    'qty': 'qty', 'количество': 'qty',
+}
+# Обязательные поля -> название столбца для сообщения об ошибке
+REQUIRED_FIELDS = {'nomenclature': 'Номенклатура', 'date': 'Дата', 'qty': 'Количество'}
+
+# Сколько отклонённых строк возвращать в отчёте (всего - в rejected_count)
+REJECTED_REPORT_LIMIT = 500
+
+# До этого размера подготовленные для COPY строки держатся в памяти, дальше - во временном файле
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+IMPORT_NOTE = 'Импорт остатков'
+
+
+class StockImportError(Exception):
+    """Файл импорта не удалось разобрать целиком (формат, заголовки)"""
+
+
+def _read_csv_rows(stream):
+    """Строки CSV-файла; разделитель ';' (выгрузка Excel) или ','"""
+    reader = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = reader.read(4096)
+    reader.seek(0)
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=';,').delimiter
+    except csv.Error:
+        delimiter = ';'
+    return csv.reader(reader, delimiter=delimiter)
+
+
+def _read_xlsx_rows(stream):
+    """Строки первого листа XLSX (read-only режим openpyxl, требует openpyxl)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise StockImportError("Для импорта из XLSX установите openpyxl")
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    return workbook.worksheets[0].iter_rows(values_only=True)
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value or '').strip()
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_qty(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_ral(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip() if value is not None else ''
+
+
+def validate_import_row(values):
+    """Проверяет строку файла: (номенклатура, RAL или None, дата, количество) или текст ошибки"""
+    nomenclature = str(values.get('nomenclature') or '').strip()
+    if not nomenclature:
+        return "Не указана номенклатура"
+    ral = _parse_ral(values.get('ral'))
+    if len(ral) > 4:
+        return f"Неверный RAL: {ral}"
+    date_stock = _parse_date(values.get('date'))
+    if not date_stock:
+        return f"Неверная дата: {values.get('date')}"
+    qty = _parse_qty(values.get('qty'))
+    if qty is None or qty <= 0:
+        return f"Неверное количество: {values.get('qty')}"
+    return nomenclature, ral or None, date_stock, qty
+
+
+def _prepare_rows(rows, spool, rejected):
+    """Проверяет строки файла и пишет годные в spool в формате CSV для COPY.
+
+    Первая строка - заголовки. Возвращает число строк с данными.
+    """
+    header = next(rows, None)
+    if not header:
+        raise StockImportError("Файл пуст")
+    fields = [IMPORT_COLUMNS.get(str(name or '').strip().lower()) for name in header]
+    missing = [label for field, label in REQUIRED_FIELDS.items() if field not in fields]
+    if missing:
+        raise StockImportError(f"В файле нет столбцов: {', '.join(missing)}")
+
+    writer = csv.writer(spool)
+    total = 0
+    for line_no, row in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in row):
+            continue
+        total += 1
+        values = {field: value for field, value in zip(fields, row) if field}
+        parsed = validate_import_row(values)
+        if isinstance(parsed, str):
+            rejected.append({'line': line_no, 'reason': parsed})
+            continue
+        nomenclature, ral, date_stock, qty = parsed
+        # Пустое поле в COPY CSV - NULL
+        writer.writerow([line_no, nomenclature, ral or '', date_stock.isoformat(), qty])
+    return total
+
+
+def import_stock_file(upload):
+    """Импортирует остатки из загруженного CSV/XLSX в текущей транзакции и фиксирует её.
+
+    Строки проверяются в Python, годные потоком уходят через COPY во
+    временную таблицу, номенклатуры сверяются с products одним JOIN, а
+    партии сливаются в stocks одним INSERT ... ON CONFLICT по ключу
+    stocks_batch_uq: существующей партии прибавляется количество. Каждая
+    затронутая партия получает движение-приход в журнале остатков; приход
+    сопоставляется с партией по тому же ключу, что и ON CONFLICT (пустой RAL
+    в файле - NULL, у старых партий может быть '').
+    Возвращает отчёт: rows, created, updated, rejected, rejected_count.
+    """
+    filename = (upload.filename or '').lower()
+    if filename.endswith('.xlsx'):
+        rows = iter(_read_xlsx_rows(upload.stream))
+    elif filename.endswith('.csv'):
+        rows = iter(_read_csv_rows(upload.stream))
+    else:
+        raise StockImportError("Поддерживаются файлы .csv и .xlsx")
+
+    rejected = []
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', newline='', encoding='utf-8') as spool:
+        total = _prepare_rows(rows, spool, rejected)
+        spool.seek(0)
+
+        db.session.execute(text("""
+            CREATE TEMP TABLE stock_import_staging (
+                line_no INT4 NOT NULL,
+                nomenclature VARCHAR NOT NULL,
+                ral_stock VARCHAR(4) NULL,
+                date_stock DATE NOT NULL,
+                count_stock INT4 NOT NULL
+            ) ON COMMIT DROP
+        """))
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert("COPY stock_import_staging FROM STDIN WITH (FORMAT csv)", spool)
+        finally:
+            cursor.close()
+
+    unknown = db.session.execute(text("""
+        SELECT s.line_no, s.nomenclature
+        FROM stock_import_staging s
+        LEFT JOIN products p ON p.nomenclature_product = s.nomenclature
+        WHERE p.id_product IS NULL
+    """)).all()
+    rejected.extend({'line': line_no, 'reason': f"Товар с номенклатурой {nomenclature} не найден"}
+                    for line_no, nomenclature in unknown)
+
+    lock_movement_writes()
+    # Строки одной партии суммируются заранее: ON CONFLICT не может
+    # обновить одну и ту же строку stocks дважды за оператор
+    created, updated = db.session.execute(text("""
+        WITH src AS (
+            SELECT p.id_product, s.ral_stock, s.date_stock, SUM(s.count_stock) AS count_stock
+            FROM stock_import_staging s
+            JOIN (SELECT nomenclature_product, MIN(id_product) AS id_product
+                  FROM products GROUP BY nomenclature_product) p
+              ON p.nomenclature_product = s.nomenclature
+            GROUP BY p.id_product, s.ral_stock, s.date_stock
+        ), merged AS (
+            INSERT INTO stocks (id_product, ral_stock, date_stock, count_stock, expires_at_stock)
+            SELECT src.id_product, src.ral_stock, src.date_stock, src.count_stock,
+                   (src.date_stock + make_interval(months => p.expiration_month_product))::date
+            FROM src
+            JOIN products p ON p.id_product = src.id_product
+            ON CONFLICT (id_product, (coalesce(ral_stock, '')), date_stock)
+            DO UPDATE SET count_stock = stocks.count_stock + EXCLUDED.count_stock
+            RETURNING id_stock, id_product, ral_stock, date_stock, (xmax = 0) AS inserted
+        ), movements AS (
+            INSERT INTO stock_movements (id_stock, kind_movement, quantity_movement, note_movement, created_at_movement)
+            SELECT m.id_stock, :kind, src.count_stock, :note, :now
+            FROM merged m
+            JOIN src ON src.id_product = m.id_product
+                    AND src.date_stock = m.date_stock
+                    AND coalesce(src.ral_stock, '') = coalesce(m.ral_stock, '')
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM merged
+    """), {'kind': MOVEMENT_RECEIPT, 'note': IMPORT_NOTE, 'now': datetime.utcnow()}).one()
+    if created or updated:
+        mark_stock_changed()
+    db.session.commit()
+
+    rejected.sort(key=lambda item: item['line'])
+    return {
+        'rows': total,
+        'created': created,
+        'updated': updated,
+        'rejected': rejected[:REJECTED_REPORT_LIMIT],
+        'rejected_count': len(rejected)
+    }
@@ -0,0 +1,165 @@
+from datetime import datetime
+from sqlalchemy import and_, func, insert, literal, select, text
+from .models import db, Stock, StockMovement, StockSnapshot
+from .stock_series import mark_stock_changed
+
+# Виды движений по партии. Сумма всех движений - свободный остаток (count_stock);
+# сумма без резервов - физический остаток на складе
+MOVEMENT_RECEIPT = 'receipt'            # приход партии на склад
+MOVEMENT_RESERVATION = 'reservation'    # резерв под заказ (< 0) и его снятие (> 0)
+MOVEMENT_SHIPMENT = 'shipment'          # отгрузка заказа (< 0) и возврат отгрузки (> 0)
+MOVEMENT_CORRECTION = 'correction'      # ручная корректировка остатка
+MOVEMENT_KINDS = (MOVEMENT_RECEIPT, MOVEMENT_RESERVATION, MOVEMENT_SHIPMENT, MOVEMENT_CORRECTION)
+
+# Барьер снимков: транзакция, пишущая движения, держит разделяемую advisory-блокировку
+# до своего конца, а снимок на мгновение берёт её исключительно. После этого все
+# выданные id движений принадлежат завершённым транзакциям, и наибольший из них -
+# надёжная граница снимка: позже зафиксированных движений с меньшим id не бывает
+MOVEMENT_WRITERS_LOCK_KEY = 3900391
+
+
+def _has_advisory_locks():
+    # SQLite пропускает писателей по одному, барьер там не нужен
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def lock_movement_writes():
+    """Вход в барьер снимков: вызывать в транзакции до вставки в stock_movements"""
+    if _has_advisory_locks():
+        db.session.execute(text('SELECT pg_advisory_xact_lock_shared(:key)'), {'key': MOVEMENT_WRITERS_LOCK_KEY})
+
+
+def settled_movement_watermark():
+    """Наибольший id движения, все движения до которого зафиксированы или откачены"""
+    if not _has_advisory_locks():
+        return db.session.query(func.max(StockMovement.id_movement)).scalar() or 0
+    params = {'key': MOVEMENT_WRITERS_LOCK_KEY}
+    db.session.execute(text('SELECT pg_advisory_lock(:key)'), params)
+    try:
+        return db.session.query(func.max(StockMovement.id_movement)).scalar() or 0
+    finally:
+        db.session.execute(text('SELECT pg_advisory_unlock(:key)'), params)
+
+
+def record_movements(movements):
+    """Пакетно добавляет движения в текущую транзакцию.
+
+    movements - словари с ключами id_stock, kind, quantity (со знаком)
+    и необязательными id_order, note. Нулевые движения пропускаются.
+    Заодно ставится обновление представления product_stock_series.
+    """
+    now = datetime.utcnow()
+    rows = [{
+        'id_stock': movement['id_stock'],
+        'kind_movement': movement['kind'],
+        'quantity_movement': movement['quantity'],
+        'id_order': movement.get('id_order'),
+        'note_movement': movement.get('note'),
+        'created_at_movement': now
+    } for movement in movements if movement['quantity']]
+    if rows:
+        lock_movement_writes()
+        db.session.execute(insert(StockMovement), rows)
+        mark_stock_changed({row['id_stock'] for row in rows})
+
+
+def record_movement(id_stock, kind, quantity, id_order=None, note=None):
+    """Добавляет одно движение по партии"""
+    record_movements([{'id_stock': id_stock, 'kind': kind, 'quantity': quantity,
+                       'id_order': id_order, 'note': note}])
+
+
+def _latest_snapshots(at=None):
+    """Подзапрос: последний снимок каждой партии (сделанный не позже at)"""
+    latest = select(StockSnapshot.id_stock, func.max(StockSnapshot.id_movement).label('id_movement'))
+    if at:
+        latest = latest.where(StockSnapshot.created_at_snapshot <= at)
+    latest = latest.group_by(StockSnapshot.id_stock).subquery()
+
+    return select(StockSnapshot.id_stock, StockSnapshot.id_movement, StockSnapshot.balance_snapshot)\
+        .join(latest, and_(StockSnapshot.id_stock == latest.c.id_stock,
+                           StockSnapshot.id_movement == latest.c.id_movement))\
+        .subquery()
+
+
+def get_stock_balances(stock_ids=None, at=None):
+    """Остатки партий по журналу: последний снимок плюс движения после него.
+
+    at - момент времени для исторического остатка (по умолчанию - сейчас).
+    Возвращает словарь id партии -> остаток.
+    """
+    snapshots = _latest_snapshots(at)
+
+    tail = select(StockMovement.id_stock, func.sum(StockMovement.quantity_movement).label('delta'))\
+        .outerjoin(snapshots, snapshots.c.id_stock == StockMovement.id_stock)\
+        .where(StockMovement.id_movement > func.coalesce(snapshots.c.id_movement, 0))
+    if at:
+        tail = tail.where(StockMovement.created_at_movement <= at)
+    tail = tail.group_by(StockMovement.id_stock).subquery()
+
+    query = select(
+        Stock.id_stock,
+        func.coalesce(snapshots.c.balance_snapshot, 0) + func.coalesce(tail.c.delta, 0)
+    ).outerjoin(snapshots, snapshots.c.id_stock == Stock.id_stock)\
+        .outerjoin(tail, tail.c.id_stock == Stock.id_stock)
+    if stock_ids is not None:
+        query = query.where(Stock.id_stock.in_(stock_ids))
+
+    return {id_stock: int(balance) for id_stock, balance in db.session.execute(query)}
+
+
+def get_stock_movements(id_stock, date_from=None, date_to=None):
+    """Движения по партии за период, в порядке записи"""
+    query = StockMovement.query.filter(StockMovement.id_stock == id_stock)
+    if date_from:
+        query = query.filter(StockMovement.created_at_movement >= date_from)
+    if date_to:
+        query = query.filter(StockMovement.created_at_movement <= date_to)
+    return query.order_by(StockMovement.id_movement).all()
+
+
+def take_snapshots():
+    """Снимает остатки всех партий, по которым были движения после прошлого снимка.
+
+    Граница снимка - id движения из settled_movement_watermark, а не время:
+    движение транзакции, зафиксированной позже, получит id выше границы и
+    попадёт в следующий снимок. Один INSERT ... SELECT: новый снимок =
+    прошлый снимок + движения после него до границы. Возвращает число
+    новых снимков.
+    """
+    now = datetime.utcnow()
+    watermark = settled_movement_watermark()
+    snapshots = _latest_snapshots()
+
+    new_snapshots = select(
+        StockMovement.id_stock,
+        func.max(StockMovement.id_movement),
+        func.coalesce(snapshots.c.balance_snapshot, 0) + func.sum(StockMovement.quantity_movement),
+        literal(now)
+    ).outerjoin(snapshots, snapshots.c.id_stock == StockMovement.id_stock)\
+        .where(StockMovement.id_movement > func.coalesce(snapshots.c.id_movement, 0),
+               StockMovement.id_movement <= watermark)\
+        .group_by(StockMovement.id_stock, snapshots.c.balance_snapshot)
+
+    result = db.session.execute(insert(StockSnapshot).from_select(
+        ['id_stock', 'id_movement', 'balance_snapshot', 'created_at_snapshot'], new_snapshots
+    ))
+    return result.rowcount
+
+
+def record_opening_balances():
+    """Начальные остатки: корректировка на count_stock для партий без движений"""
+    has_movements = select(StockMovement.id_movement).where(StockMovement.id_stock == Stock.id_stock).exists()
+    stocks = db.session.query(Stock.id_stock, Stock.count_stock).filter(~has_movements).all()
+    record_movements([{'id_stock': id_stock, 'kind': MOVEMENT_CORRECTION, 'quantity': count_stock,
+                       'note': 'Начальный остаток'} for id_stock, count_stock in stocks])
+    return len(stocks)
+
+
+def find_balance_mismatches():
+    """Партии, у которых count_stock расходится с остатком по журналу"""
+    balances = get_stock_balances()
+    stocks = db.session.query(Stock.id_stock, Stock.count_stock).all()
+    return [(id_stock, count_stock, balances.get(id_stock, 0))
+            for id_stock, count_stock in stocks
+            if count_stock != balances.get(id_stock, 0)]
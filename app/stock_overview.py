@@ -0,0 +1,90 @@
+import threading
+import time
+from sqlalchemy import func, select
+from .models import db, Product, Stock, Analyzis
+
+# Сколько секунд сводка остатков живёт в кэше процесса. Запись остатков из
+# админки сбрасывает кэш сразу, резервы заказов и другие процессы - по TTL.
+STOCK_OVERVIEW_TTL = 30
+
+_cache = None  # (момент устаревания, products, totals)
+_lock = threading.Lock()
+
+
+def _stock_overview_query():
+    """Один запрос: товары с суммой остатков, числом партий, последней партией и анализом"""
+    totals = select(
+        Stock.id_product,
+        func.sum(Stock.count_stock).label('qty'),
+        func.count(Stock.id_stock).label('batches')
+    ).group_by(Stock.id_product).subquery()
+
+    latest_batch = select(
+        Stock.id_product, Stock.ral_stock, Stock.date_stock,
+        func.row_number().over(partition_by=Stock.id_product,
+                               order_by=(Stock.date_stock.desc(), Stock.id_stock.desc())).label('rn')
+    ).subquery()
+
+    latest_analyzis = select(
+        Stock.id_product, Analyzis.id_analyzis,
+        func.row_number().over(partition_by=Stock.id_product,
+                               order_by=Analyzis.id_analyzis.desc()).label('rn')
+    ).join(Stock, Stock.id_stock == Analyzis.id_stock).subquery()
+
+    return select(
+        Product.id_product, Product.title_product, Product.nomenclature_product, Product.price_product,
+        func.coalesce(totals.c.qty, 0).label('qty'),
+        func.coalesce(totals.c.batches, 0).label('batches'),
+        latest_batch.c.ral_stock, latest_batch.c.date_stock,
+        latest_analyzis.c.id_analyzis
+    ).outerjoin(totals, totals.c.id_product == Product.id_product)\
+        .outerjoin(latest_batch, (latest_batch.c.id_product == Product.id_product) & (latest_batch.c.rn == 1))\
+        .outerjoin(latest_analyzis, (latest_analyzis.c.id_product == Product.id_product) & (latest_analyzis.c.rn == 1))\
+        .order_by(Product.title_product, Product.id_product)
+
+
+def load_stock_overview():
+    """Сводка остатков из базы: список товаров-словарей и итоги страницы"""
+    products = [{
+        'id': row.id_product,
+        'id_product': row.id_product,
+        'title': row.title_product,
+        'nomenclature_product': row.nomenclature_product,
+        'price_product': row.price_product,
+        'stock_qty': int(row.qty),
+        'batches': row.batches,
+        'ral': row.ral_stock,
+        'date': row.date_stock,
+        'id_analyzis': row.id_analyzis
+    } for row in db.session.execute(_stock_overview_query())]
+
+    in_stock_count = sum(1 for product in products if product['stock_qty'] > 0)
+    totals = {
+        'total_stock': sum(product['stock_qty'] for product in products),
+        'in_stock_count': in_stock_count,
+        'out_of_stock_count': len(products) - in_stock_count
+    }
+    return products, totals
+
+
+def get_stock_overview():
+    """Сводка остатков для страниц остатков админа и менеджера, с кэшем на STOCK_OVERVIEW_TTL.
+
+    Результат общий для всех запросов процесса, изменять его нельзя.
+    """
+    global _cache
+    with _lock:
+        if _cache and _cache[0] > time.monotonic():
+            return _cache[1], _cache[2]
+
+    products, totals = load_stock_overview()
+    with _lock:
+        _cache = (time.monotonic() + STOCK_OVERVIEW_TTL, products, totals)
+    return products, totals
+
+
+def invalidate_stock_overview():
+    """Сбрасывает кэш сводки остатков текущего процесса"""
+    global _cache
+    with _lock:
+        _cache = None
@@ -0,0 +1,141 @@
+from sqlalchemy import select
+from .models import db, User, Product, Stock, Analyzis, Order, StockOrder
+from .order_export import EXPORT_BATCH_SIZE, stream_csv
+
+# Сколько строк отзыва показывать на странице (полный список - в CSV)
+RECALL_PAGE_LIMIT = 500
+
+RECALL_COLUMNS = [
+    'Партия', 'Номенклатура', 'Товар', 'RAL', 'Дата производства', 'Годен до',
+    'Заказ', 'Дата заказа', 'Статус', 'Компания', 'Покупатель', 'Email', 'Телефон',
+    'Количество', 'Цена'
+]
+
+
+def parse_recall_id(value):
+    """Номер партии или анализа из параметра запроса, пустой или битый - None"""
+    value = (value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def recall_lines_query(id_stock=None, id_analyzis=None, email=''):
+    """Строки отзыва: партия -> заказы -> покупатели или покупатель -> партии.
+
+    Запрос идёт от связки "stock-order": по партии - индекс
+    stock_order_stock_cover_idx, по покупателю - users по email (уникальный
+    индекс), orders_user_created_idx и stock_order_order_cover_idx.
+    Анализ сводится к своей партии по первичному ключу analyzis.
+    """
+    stmt = select(
+        Stock.id_stock, Product.nomenclature_product, Product.title_product, Stock.ral_stock,
+        Stock.date_stock, Stock.expires_at_stock,
+        Order.id_order, Order.created_at_order, Order.status_order,
+        User.id_user, User.company_name_user, User.fullname_user, User.email_user, User.phone_user,
+        StockOrder.count_order, StockOrder.price_order
+    ).select_from(StockOrder)\
+        .join(Stock, Stock.id_stock == StockOrder.id_stock)\
+        .join(Product, Product.id_product == Stock.id_product)\
+        .join(Order, Order.id_order == StockOrder.id_order)\
+        .join(User, User.id_user == Order.id_user)
+
+    if id_stock is not None:
+        stmt = stmt.where(StockOrder.id_stock == id_stock)
+    if id_analyzis is not None:
+        stmt = stmt.where(StockOrder.id_stock == select(Analyzis.id_stock)
+                          .where(Analyzis.id_analyzis == id_analyzis).scalar_subquery())
+    if email:
+        stmt = stmt.where(User.email_user == email)
+    return stmt.order_by(StockOrder.id_stock, Order.created_at_order, Order.id_order)
+
+
+def _has_filter(id_stock=None, id_analyzis=None, email=''):
+    # Отчёт без условия выгрузил бы всю историю продаж остатков
+    return id_stock is not None or id_analyzis is not None or bool(email)
+
+
+def get_recall_report(id_stock=None, id_analyzis=None, email='', limit=RECALL_PAGE_LIMIT):
+    """Отчёт для страницы: строки (не больше limit), сводка по покупателям и по партиям.
+
+    Сводки считаются по показанным строкам; truncated - строк больше limit.
+    """
+    filters = dict(id_stock=id_stock, id_analyzis=id_analyzis, email=email)
+    if not _has_filter(**filters):
+        return {'lines': [], 'customers': [], 'batches': [], 'truncated': False}
+
+    rows = db.session.execute(recall_lines_query(**filters).limit(limit + 1)).all()
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+
+    customers, batches = {}, {}
+    for row in rows:
+        qty = row.count_order or 0
+        customer = customers.setdefault(row.id_user, {
+            'id_user': row.id_user,
+            'company': row.company_name_user,
+            'fullname': row.fullname_user,
+            'email': row.email_user,
+            'phone': row.phone_user,
+            'orders': set(),
+            'quantity': 0
+        })
+        customer['orders'].add(row.id_order)
+        customer['quantity'] += qty
+
+        batch = batches.setdefault(row.id_stock, {
+            'id_stock': row.id_stock,
+            'nomenclature': row.nomenclature_product,
+            'title': row.title_product,
+            'ral': row.ral_stock,
+            'date_stock': row.date_stock,
+            'expires_at_stock': row.expires_at_stock,
+            'orders': set(),
+            'quantity': 0
+        })
+        batch['orders'].add(row.id_order)
+        batch['quantity'] += qty
+
+    for item in (*customers.values(), *batches.values()):
+        item['orders'] = len(item['orders'])
+
+    return {
+        'lines': rows,
+        'customers': sorted(customers.values(), key=lambda item: item['company']),
+        'batches': list(batches.values()),
+        'truncated': truncated
+    }
+
+
+def iter_recall_rows(**filters):
+    """Строки отзыва для CSV по одной, через серверный курсор (yield_per)"""
+    if not _has_filter(**filters):
+        return
+    result = db.session.execute(
+        recall_lines_query(**filters),
+        execution_options={'yield_per': EXPORT_BATCH_SIZE}
+    )
+    try:
+        for row in result:
+            yield [
+                row.id_stock,
+                row.nomenclature_product,
+                row.title_product,
+                row.ral_stock or '',
+                row.date_stock.strftime('%d.%m.%Y') if row.date_stock else '',
+                row.expires_at_stock.strftime('%d.%m.%Y') if row.expires_at_stock else '',
+                row.id_order,
+                row.created_at_order.strftime('%d.%m.%Y') if row.created_at_order else '',
+                row.status_order,
+                row.company_name_user,
+                row.fullname_user,
+                row.email_user,
+                row.phone_user,
+                row.count_order or 0,
+                row.price_order
+            ]
+    finally:
+        result.close()
+
+
+def generate_recall_csv(**filters):
+    """CSV отчёта об отзыве партии кусками по EXPORT_BATCH_SIZE строк"""
+    return stream_csv(RECALL_COLUMNS, iter_recall_rows(**filters))
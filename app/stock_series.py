@@ -0,0 +1,161 @@
+from datetime import date, timedelta
+from sqlalchemy import Date, text
+from .models import db
+from .order_projection import encode_cursor, decode_cursor
+from .outbox import register_handler, enqueue_event, EVENT_STOCK_CHANGED
+
+# Не чаще одного обновления product_stock_series за столько секунд на процесс
+# воркера: изменения, пришедшие за паузу, попадают в то же обновление
+STOCK_SERIES_REFRESH_INTERVAL = 5
+
+# Товаров на странице склада покупателя
+STOCK_PRODUCTS_PER_PAGE = 20
+
+STOCK_SERIES_ORDER = {
+    'nomenclature': 'nomenclature_ral, date_stock, id_stock',
+    'title': 'title_product, ral_stock, date_stock, id_stock',
+}
+
+# Типы столбцов-дат для text(): результат содержит date, а не строки
+SERIES_DATE_COLUMNS = {'date_stock': Date, 'expires_at_stock': Date}
+
+
+def parse_min_shelf_days(value, default=None):
+    """Фильтр партий по сроку годности из параметра запроса.
+
+    'all' - все партии (None), число - партии, годные ещё не меньше стольких
+    дней (0 - без просроченных); пустое или неверное значение - default.
+    """
+    if value == 'all':
+        return None
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return default
+    return days if days >= 0 else default
+
+
+def get_stock_series(order='nomenclature', min_shelf_days=None, today=None):
+    """Партии в наличии из материализованного представления product_stock_series.
+
+    min_shelf_days - оставить только партии, годные ещё не меньше стольких
+    дней (условие по индексу product_stock_series_expires_idx); None - все.
+    """
+    params = {}
+    where = ''
+    if min_shelf_days is not None:
+        where = 'WHERE expires_at_stock >= :min_expires'
+        params['min_expires'] = (today or date.today()) + timedelta(days=min_shelf_days)
+    return db.session.execute(text(f"""
+        SELECT id_stock, id_product, title_product, nomenclature_product, ral_stock,
+               date_stock, expires_at_stock, nomenclature_ral, remaining_quantity
+        FROM product_stock_series
+        {where}
+        ORDER BY {STOCK_SERIES_ORDER[order]}
+    """).columns(**SERIES_DATE_COLUMNS), params).fetchall()
+
+
+def get_stock_products_page(cursor=None, per_page=STOCK_PRODUCTS_PER_PAGE, min_shelf_days=0, search='', today=None):
+    """Страница склада покупателя: товары с партиями в наличии, сгруппированные по товару.
+
+    Один запрос: подзапрос выбирает per_page + 1 товаров после курсора прямо
+    из product_stock_series (keyset по title_product, id_product, индекс
+    product_stock_series_title_idx), к ним присоединяются их партии с теми же
+    условиями. Общий CTE для обеих частей PostgreSQL материализовал бы, и
+    индекс не использовался бы. search ищет по названию, номенклатуре и RAL.
+    Возвращает группы [{id_product, title, nomenclature, total_quantity, batches}]
+    и курсор следующей страницы.
+    """
+    conditions = []
+    params = {'limit': per_page + 1}
+    if min_shelf_days is not None:
+        conditions.append('{s}expires_at_stock >= :min_expires')
+        params['min_expires'] = (today or date.today()) + timedelta(days=min_shelf_days)
+    if search:
+        conditions.append("(lower({s}title_product) LIKE :search OR lower({s}nomenclature_ral) LIKE :search)")
+        params['search'] = f"%{search.lower()}%"
+
+    page_conditions = list(conditions)
+    position = decode_cursor(cursor)
+    if position and len(position) == 2:
+        page_conditions.append('(title_product, id_product) > (:after_title, :after_id)')
+        params.update(after_title=position[0], after_id=position[1])
+
+    page_filters = f"WHERE {' AND '.join(page_conditions).format(s='')}" if page_conditions else ''
+    batch_filters = f"WHERE {' AND '.join(conditions).format(s='s.')}" if conditions else ''
+    rows = db.session.execute(text(f"""
+        WITH page_products AS (
+            SELECT title_product, id_product
+            FROM product_stock_series
+            {page_filters}
+            GROUP BY title_product, id_product
+            ORDER BY title_product, id_product
+            LIMIT :limit
+        )
+        SELECT s.id_stock, s.id_product, s.title_product, s.nomenclature_product, s.ral_stock,
+               s.date_stock, s.expires_at_stock, s.nomenclature_ral, s.remaining_quantity
+        FROM page_products p
+        JOIN product_stock_series s ON s.id_product = p.id_product
+        {batch_filters}
+        ORDER BY s.title_product, s.id_product, s.date_stock, s.id_stock
+    """).columns(**SERIES_DATE_COLUMNS), params).fetchall()
+
+    groups = []
+    for row in rows:
+        if not groups or groups[-1]['id_product'] != row.id_product:
+            groups.append({'id_product': row.id_product, 'title': row.title_product,
+                           'nomenclature': row.nomenclature_product, 'total_quantity': 0, 'batches': []})
+        groups[-1]['total_quantity'] += row.remaining_quantity
+        groups[-1]['batches'].append({
+            'id_stock': row.id_stock,
+            'nomenclature_ral': row.nomenclature_ral,
+            'ral': row.ral_stock,
+            'date_stock': row.date_stock,
+            'expires_at_stock': row.expires_at_stock,
+            'remaining_quantity': row.remaining_quantity
+        })
+
+    next_cursor = None
+    if len(groups) > per_page:
+        groups = groups[:per_page]
+        next_cursor = encode_cursor([groups[-1]['title'], groups[-1]['id_product']])
+    return groups, next_cursor
+
+
+def get_stock_series_item(id_stock):
+    """Одна партия из product_stock_series вместе с карточкой товара"""
+    return db.session.execute(text("""
+        SELECT s.id_stock, s.nomenclature_ral, s.ral_stock, s.date_stock, s.expires_at_stock,
+               s.remaining_quantity, p.id_product, p.title_product, p.description_product,
+               p.price_product, p.img_path_product, p.nomenclature_product
+        FROM product_stock_series s
+        JOIN products p ON p.id_product = s.id_product
+        WHERE s.id_stock = :id_stock
+    """).columns(**SERIES_DATE_COLUMNS), {'id_stock': id_stock}).fetchone()
+
+
+def mark_stock_changed(stock_ids=None):
+    """Ставит обновление product_stock_series в outbox текущей транзакции.
+
+    Представление обновит воркер outbox после фиксации транзакции, так что
+    обновление видит уже зафиксированные остатки. Воркер запускается в
+    процессе приложения по умолчанию; при OUTBOX_WORKER=0 должен работать
+    outbox_worker.py, иначе страницы остатков не обновятся.
+    """
+    enqueue_event(EVENT_STOCK_CHANGED, {'stock_ids': sorted(stock_ids or [])})
+
+
+def refresh_stock_series(payloads=None):
+    """Обработчик outbox: одно REFRESH ... CONCURRENTLY на пачку событий.
+
+    CONCURRENTLY не блокирует чтение представления страницами остатков
+    (нужен уникальный индекс product_stock_series_stock_uq). Паузу
+    STOCK_SERIES_REFRESH_INTERVAL между обновлениями выдерживает outbox
+    (min_interval), не удерживая транзакцию пачки.
+    """
+    db.session.execute(text('REFRESH MATERIALIZED VIEW CONCURRENTLY product_stock_series'))
+
+
+def register_stock_series_handlers():
+    """Подписывает обновление product_stock_series на изменения остатков"""
+    register_handler(EVENT_STOCK_CHANGED, refresh_stock_series, min_interval=STOCK_SERIES_REFRESH_INTERVAL)
@@ -1,11 +1,20 @@
 import json
 import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from functools import wraps
 from flask import session, redirect, url_for, flash
 from pathlib import Path
 from uuid import uuid4
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: только блокировка внутри процесса
+    fcntl = None
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,6 +29,8 @@ ANALYTICS = DATA_DIR / "analytics"
 CHATS = "data/chats"
 
 CHATS_DIR = Path("data/chats")
+# Индекс назначений менеджеров: {user_id: manager_id} для всех чатов
+CHAT_ASSIGNMENTS = CHATS_DIR.parent / "chat_assignments.json"
 
 
 def ensure_chats_dir():
@@ -230,9 +241,88 @@ def assign_manager_to_chat(user_id, manager_id):
         chat["assigned_manager"] = manager_id
         chat["bot_enabled"] = False  # При назначении менеджера выключаем бота
         write_json(get_user_chat_file(user_id), chat)
+        set_chat_assignment(user_id, manager_id)
         return True
     return False
 
+
+# Индекс назначений меняется чтением-изменением-записью: потоки процесса
+# ждут друг друга на _assignments_lock, процессы - на flock файла блокировки
+_assignments_lock = threading.Lock()
+CHAT_ASSIGNMENTS_LOCK = CHAT_ASSIGNMENTS.with_suffix('.lock')
+
+
+@contextmanager
+def _locked_chat_assignments():
+    with _assignments_lock:
+        if fcntl is None:
+            yield
+            return
+        CHAT_ASSIGNMENTS_LOCK.parent.mkdir(parents=True, exist_ok=True)
+        with open(CHAT_ASSIGNMENTS_LOCK, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _build_chat_assignments():
+    assignments = {}
+    for chat_file in Path(CHATS).glob('*.json'):
+        try:
+            chat_data = read_json(chat_file)
+        except Exception as e:
+            print(f"Ошибка чтения чата {chat_file}: {e}")
+            continue
+        if chat_data and chat_data.get('assigned_manager'):
+            assignments[chat_file.stem] = chat_data['assigned_manager']
+    write_json_atomic(CHAT_ASSIGNMENTS, assignments)
+    return assignments
+
+
+def _read_chat_assignments():
+    try:
+        assignments = read_json(CHAT_ASSIGNMENTS)
+    except ValueError as e:
+        logger.warning(f"Индекс назначений повреждён, перестраиваем: {e}")
+        assignments = None
+    return assignments if isinstance(assignments, dict) else None
+
+
+def rebuild_chat_assignments():
+    """Перестраивает индекс назначений менеджеров по файлам чатов"""
+    with _locked_chat_assignments():
+        return _build_chat_assignments()
+
+
+def get_chat_assignments():
+    """Возвращает индекс назначений {user_id: manager_id} одним чтением файла.
+
+    Файл заменяется атомарно, так что читатель видит старую или новую версию
+    целиком; отсутствующий или повреждённый индекс перестраивается по чатам.
+    """
+    assignments = _read_chat_assignments()
+    if assignments is None:
+        with _locked_chat_assignments():
+            assignments = _read_chat_assignments()
+            if assignments is None:
+                assignments = _build_chat_assignments()
+    return assignments
+
+
+def set_chat_assignment(user_id, manager_id):
+    """Обновляет назначение менеджера в индексе"""
+    with _locked_chat_assignments():
+        assignments = _read_chat_assignments()
+        if assignments is None:
+            assignments = _build_chat_assignments()
+        if manager_id:
+            assignments[str(user_id)] = manager_id
+        else:
+            assignments.pop(str(user_id), None)
+        write_json_atomic(CHAT_ASSIGNMENTS, assignments)
+
 def ensure_data_dirs():
     """
     Создает необходимые директории и файлы для работы приложения.
@@ -395,6 +485,21 @@ def write_json(path, data):
     p.parent.mkdir(parents=True, exist_ok=True)
     p.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
+def write_json_atomic(path, data):
+    """Записывает JSON во временный файл рядом и подменяет им path (os.replace)"""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=p.parent, prefix=f".{p.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+            json.dump(data, tmp, ensure_ascii=False, indent=2)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, p)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
 def list_json(folder):
     folder = Path(folder)
     items = []
@@ -1,3 +1,6 @@
+/* Триграммные индексы поиска заказов требуют расширения pg_trgm */
+create extension if not exists pg_trgm;
+
 
 
 /*==============================================================*/
@@ -11,7 +14,12 @@ create table Orders (
    status_order         TEXT                 not null,
    created_at_order     DATE                 not null,
    updated_at_order     DATE                 null,
-   constraint PK_ORDERS primary key (id_order)
+   total_amount         DECIMAL              not null default 0,
+   line_count           INT4                 not null default 0,
+   idempotency_key      VARCHAR(64)          null,
+   history_version      INT4                 not null default 0,
+   constraint PK_ORDERS primary key (id_order),
+   constraint orders_idempotency_key_uq unique (id_user, idempotency_key)
 );
 
 /*==============================================================*/
@@ -28,6 +36,68 @@ create  index "user-order_FK" on Orders (
 id_user
 );
 
+/*==============================================================*/
+/* Index: orders_created_at_idx (keyset-пагинация по дате)      */
+/*==============================================================*/
+create  index orders_created_at_idx on Orders (
+created_at_order desc,
+id_order desc
+);
+
+/*==============================================================*/
+/* Index: orders_status_rank_idx (сортировка по статусу)        */
+/*==============================================================*/
+create  index orders_status_rank_idx on Orders (
+(case status_order
+    when 'pending_moderation' then 0
+    when 'approved' then 1
+    when 'completed' then 2
+    when 'cancelled' then 3
+    else 4 end),
+id_order
+);
+
+/*==============================================================*/
+/* Index: orders_total_idx (сортировка по сумме заказа)         */
+/*==============================================================*/
+create  index orders_total_idx on Orders (
+total_amount desc,
+id_order desc
+);
+
+/*==============================================================*/
+/* Index: "user-order_id_FK" (заказы покупателя по порядку)     */
+/*==============================================================*/
+create  index "user-order_id_FK" on Orders (
+id_user,
+id_order
+);
+
+/*==============================================================*/
+/* Index: orders_status_date_idx (поиск по статусу и периоду)   */
+/*==============================================================*/
+create  index orders_status_date_idx on Orders (
+status_order,
+created_at_order desc,
+id_order desc
+);
+
+/*==============================================================*/
+/* Index: orders_user_created_idx (история заказов покупателя) */
+/*==============================================================*/
+create  index orders_user_created_idx on Orders (
+id_user,
+created_at_order
+);
+
+/*==============================================================*/
+/* Index: orders_user_history_idx (изменения заказов для опроса) */
+/*==============================================================*/
+create  index orders_user_history_idx on Orders (
+id_user,
+history_version
+);
+
 /*==============================================================*/
 /* Table: Products                                              */
 /*==============================================================*/
@@ -41,6 +111,7 @@ create table Products (
    img_path_product     TEXT                 not null,
    expiration_month_product INT4                 not null,
    nomenclature_product TEXT                 not null,
+   reorder_threshold_product INT4            not null default 10,
    constraint PK_PRODUCTS primary key (id_product)
 );
 
@@ -51,6 +122,27 @@ create unique index Products_PK on Products (
 id_product
 );
 
+/*==============================================================*/
+/* Index: products_nomenclature_idx (товар по номенклатуре)    */
+/*==============================================================*/
+create  index products_nomenclature_idx on Products (
+nomenclature_product
+);
+
+/*==============================================================*/
+/* Index: products_nomenclature_trgm_idx (поиск заказов по товару) */
+/*==============================================================*/
+create  index products_nomenclature_trgm_idx on Products using gin (
+nomenclature_product gin_trgm_ops
+);
+
+/*==============================================================*/
+/* Index: products_title_trgm_idx (поиск заказов по товару)     */
+/*==============================================================*/
+create  index products_title_trgm_idx on Products using gin (
+title_product gin_trgm_ops
+);
+
 /*==============================================================*/
 /* Table: Stocks                                                */
 /*==============================================================*/
@@ -61,6 +153,7 @@ create table Stocks (
    count_stock          INT4                 not null,
    RAL_stock            VARCHAR(4)           null,
    date_stock           DATE                 not null,
+   expires_at_stock     DATE                 not null,
    constraint PK_STOCKS primary key (id_stock)
 );
 
@@ -85,6 +178,56 @@ create  index "stock-analyzis2_FK" on Stocks (
 id_analyzis
 );
 
+/*==============================================================*/
+/* Index: stocks_batch_uq (одна партия на товар, RAL и дату)    */
+/*==============================================================*/
+create unique index stocks_batch_uq on Stocks (
+id_product,
+(coalesce(RAL_stock, '')),
+date_stock
+);
+
+/*==============================================================*/
+/* Index: stocks_expires_idx (партии в наличии по сроку годности) */
+/*==============================================================*/
+create  index stocks_expires_idx on Stocks (
+expires_at_stock
+) where count_stock > 0;
+
+/*==============================================================*/
+/* Index: stocks_fefo_expiry_idx (автоподбор партий по сроку годности) */
+/*==============================================================*/
+create  index stocks_fefo_expiry_idx on Stocks (
+id_product,
+RAL_stock,
+expires_at_stock,
+date_stock,
+id_stock
+) where count_stock > 0;
+
+/*==============================================================*/
+/* Index: stocks_product_ral_date_idx (партии товара по RAL и дате) */
+/*==============================================================*/
+create  index stocks_product_ral_date_idx on Stocks (
+id_product,
+RAL_stock,
+date_stock
+);
+
+/*==============================================================*/
+/* Index: stocks_in_stock_idx (партии в наличии)               */
+/*==============================================================*/
+create  index stocks_in_stock_idx on Stocks (
+count_stock
+) where count_stock > 0;
+
+/*==============================================================*/
+/* Index: stocks_ral_idx (поиск заказов по RAL)                 */
+/*==============================================================*/
+create  index stocks_ral_idx on Stocks (
+RAL_stock
+);
+
 /*==============================================================*/
 /* Table: Users                                                 */
 /*==============================================================*/
@@ -109,6 +252,28 @@ create unique index Users_PK on Users (
 id_user
 );
 
+/*==============================================================*/
+/* Index: users_role_idx (пользователи по роли)                */
+/*==============================================================*/
+create  index users_role_idx on Users (
+role_user
+);
+
+/*==============================================================*/
+/* Index: users_company_name_idx (сортировка по компании)       */
+/*==============================================================*/
+create  index users_company_name_idx on Users (
+lower(company_name_user),
+id_user
+);
+
+/*==============================================================*/
+/* Index: users_company_trgm_idx (поиск заказов по компании)    */
+/*==============================================================*/
+create  index users_company_trgm_idx on Users using gin (
+company_name_user gin_trgm_ops
+);
+
 /*==============================================================*/
 /* Table: analyzis                                              */
 /*==============================================================*/
@@ -159,6 +324,7 @@ create table "product-order" (
    count                INT4                 not null,
    RAL                  VARCHAR(4)           null,
    creating_date        DATE                 not null,
+   price                DECIMAL              not null,
    constraint "PK_PRODUCT-ORDER" primary key (id_product, id_order)
 );
 
@@ -184,13 +350,130 @@ create  index "product-order2_FK" on "product-order" (
 id_order
 );
 
+/*==============================================================*/
+/* Index: product_order_ral_idx (поиск заказов по RAL)          */
+/*==============================================================*/
+create  index product_order_ral_idx on "product-order" (
+ral,
+id_order
+);
+
 create table "stock-order" (
    id_stock             INT4                 not null,
    id_order             INT4                 not null,
    count_order          INT4                 null,
+   price_order          DECIMAL              not null,
    constraint "PK_STOCK-ORDER" primary key (id_stock, id_order)
 );
 
+/*==============================================================*/
+/* Index: stock_order_stock_cover_idx (заказы партии, отзыв)    */
+/*==============================================================*/
+create  index stock_order_stock_cover_idx on "stock-order" (
+id_stock
+) include (id_order, count_order, price_order);
+
+/*==============================================================*/
+/* Index: stock_order_order_cover_idx (строки заказа из остатков) */
+/*==============================================================*/
+create  index stock_order_order_cover_idx on "stock-order" (
+id_order
+) include (id_stock, count_order, price_order);
+
+/*==============================================================*/
+/* Table: order_history_versions (версии истории заказов для кэша) */
+/*==============================================================*/
+create table order_history_versions (
+   id_user              INT4                 not null,
+   version              INT4                 not null default 0,
+   constraint PK_ORDER_HISTORY_VERSIONS primary key (id_user)
+);
+
+/*==============================================================*/
+/* Table: stock_movements (журнал движений по партиям)          */
+/*==============================================================*/
+create table stock_movements (
+   id_movement          SERIAL               not null,
+   id_stock             INT4                 not null,
+   kind_movement        VARCHAR(16)          not null,
+   quantity_movement    INT4                 not null,
+   id_order             INT4                 null,
+   note_movement        TEXT                 null,
+   created_at_movement  TIMESTAMP            not null default now(),
+   constraint PK_STOCK_MOVEMENTS primary key (id_movement),
+   constraint CKC_KIND_MOVEMENT check (kind_movement in ('receipt', 'reservation', 'shipment', 'correction'))
+);
+
+/*==============================================================*/
+/* Index: stock_movements_stock_idx (движения партии по порядку) */
+/*==============================================================*/
+create  index stock_movements_stock_idx on stock_movements (
+id_stock,
+id_movement
+);
+
+/*==============================================================*/
+/* Index: stock_movements_created_idx (остатки на дату)         */
+/*==============================================================*/
+create  index stock_movements_created_idx on stock_movements (
+created_at_movement
+);
+
+/*==============================================================*/
+/* Table: stock_snapshots (снимки остатков партий)              */
+/*==============================================================*/
+create table stock_snapshots (
+   id_stock             INT4                 not null,
+   id_movement          INT4                 not null,
+   balance_snapshot     INT4                 not null,
+   created_at_snapshot  TIMESTAMP            not null default now(),
+   constraint PK_STOCK_SNAPSHOTS primary key (id_stock, id_movement)
+);
+
+/*==============================================================*/
+/* Table: outbox_events (события заказов для фоновой обработки) */
+/*==============================================================*/
+create table outbox_events (
+   id_event             SERIAL               not null,
+   kind_event           VARCHAR(64)          not null,
+   payload_event        JSON                 not null,
+   created_at_event     TIMESTAMP            not null default now(),
+   processed_at_event   TIMESTAMP            null,
+   attempts_event       INT4                 not null default 0,
+   error_event          TEXT                 null,
+   constraint PK_OUTBOX_EVENTS primary key (id_event)
+);
+
+/*==============================================================*/
+/* Index: outbox_events_pending_idx (очередь необработанных)    */
+/*==============================================================*/
+create  index outbox_events_pending_idx on outbox_events (
+id_event
+) where processed_at_event is null;
+
+/*==============================================================*/
+/* Table: stock_alerts (предупреждения сканера остатков)        */
+/*==============================================================*/
+create table stock_alerts (
+   id_alert             SERIAL               not null,
+   kind_alert           VARCHAR(16)          not null,
+   id_product           INT4                 not null,
+   id_stock             INT4                 null,
+   quantity_alert       INT4                 not null,
+   threshold_alert      INT4                 null,
+   expires_at_alert     DATE                 null,
+   scanned_at_alert     TIMESTAMP            not null default now(),
+   constraint PK_STOCK_ALERTS primary key (id_alert),
+   constraint CKC_KIND_ALERT check (kind_alert in ('expired', 'expiring', 'low_stock'))
+);
+
+/*==============================================================*/
+/* Index: stock_alerts_kind_idx                                 */
+/*==============================================================*/
+create  index stock_alerts_kind_idx on stock_alerts (
+kind_alert
+);
+
 
 alter table "stock-order"
    add constraint "FK_STOCK-OR_STOCK-ORD_STOCKS" foreign key (id_stock)
@@ -207,6 +490,36 @@ alter table Orders
       references Users (id_user)
       on delete restrict on update restrict;
 
+alter table order_history_versions
+   add constraint "FK_ORDER_HI_USER-HIST_USERS" foreign key (id_user)
+      references Users (id_user)
+      on delete restrict on update restrict;
+
+alter table stock_movements
+   add constraint "FK_STOCK_MO_STOCK-MOV_STOCKS" foreign key (id_stock)
+      references Stocks (id_stock)
+      on delete restrict on update restrict;
+
+alter table stock_movements
+   add constraint "FK_STOCK_MO_ORDER-MOV_ORDERS" foreign key (id_order)
+      references Orders (id_order)
+      on delete restrict on update restrict;
+
+alter table stock_snapshots
+   add constraint "FK_STOCK_SN_STOCK-SNA_STOCKS" foreign key (id_stock)
+      references Stocks (id_stock)
+      on delete restrict on update restrict;
+
+alter table stock_alerts
+   add constraint "FK_STOCK_AL_PRODUCT-A_PRODUCTS" foreign key (id_product)
+      references Products (id_product)
+      on delete restrict on update restrict;
+
+alter table stock_alerts
+   add constraint "FK_STOCK_AL_STOCK-ALE_STOCKS" foreign key (id_stock)
+      references Stocks (id_stock)
+      on delete restrict on update restrict;
+
 alter table Stocks
    add constraint "FK_STOCKS_PRODUCT-S_PRODUCTS" foreign key (id_product)
       references Products (id_product)
@@ -238,14 +551,42 @@ alter table "product-order"
 /*==============================================================*/
 /* View: product_stock_series                                   */
 /*==============================================================*/
-CREATE VIEW public.product_stock_series AS
- SELECT concat(p.nomenclature_product,
+CREATE MATERIALIZED VIEW public.product_stock_series AS
+ SELECT s.id_stock,
+    s.id_product,
+    p.title_product,
+    p.nomenclature_product,
+    s.ral_stock,
+    s.date_stock,
+    s.expires_at_stock,
+    concat(p.nomenclature_product,
         CASE
             WHEN (s.ral_stock IS NOT NULL) THEN concat(' RAL ', s.ral_stock)
             ELSE ''::text
         END) AS nomenclature_ral,
-    concat('п.', s.id_stock, ' от ', to_char((s.date_stock)::timestamp with time zone, 'DD.MM.YYYY'::text), ' до ', to_char((s.date_stock + ((p.expiration_month_product || ' months'::text))::interval), 'DD.MM.YYYY'::text)) AS series_info,
     s.count_stock AS remaining_quantity
    FROM (public.stocks s
      JOIN public.products p ON ((s.id_product = p.id_product)))
   WHERE (s.count_stock > 0);
+
+/*==============================================================*/
+/* Index: product_stock_series_stock_uq (для REFRESH CONCURRENTLY) */
+/*==============================================================*/
+create unique index product_stock_series_stock_uq on product_stock_series (
+id_stock
+);
+
+/*==============================================================*/
+/* Index: product_stock_series_expires_idx                      */
+/*==============================================================*/
+create  index product_stock_series_expires_idx on product_stock_series (
+expires_at_stock
+);
+
+/*==============================================================*/
+/* Index: product_stock_series_title_idx (склад по товарам)     */
+/*==============================================================*/
+create  index product_stock_series_title_idx on product_stock_series (
+title_product,
+id_product
+);
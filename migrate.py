@@ -0,0 +1,20 @@
+import sys
+from app import create_app
+from app.migrations import migrate, get_pending_migrations
+
+app = create_app(background_workers=False)
+
+# Usage: python migrate.py           apply pending migrations from migrations/
+#        python migrate.py --status  list pending migrations without applying them
+with app.app_context():
+    if '--status' in sys.argv:
+        pending = get_pending_migrations()
+        for version, path in pending:
+            print(f"pending: {path.name}")
+        if not pending:
+            print("Schema is up to date")
+    else:
+        applied = migrate()
+        for version in applied:
+            print(f"applied: {version}")
+        print(f"{len(applied)} migration(s) applied")
@@ -0,0 +1,6 @@
+-- Версии истории заказов покупателей (инвалидация кэша истории)
+CREATE TABLE IF NOT EXISTS order_history_versions (
+    id_user INT4 NOT NULL REFERENCES users (id_user),
+    version INT4 NOT NULL DEFAULT 0,
+    CONSTRAINT PK_ORDER_HISTORY_VERSIONS PRIMARY KEY (id_user)
+);
@@ -0,0 +1,9 @@
+-- Ключ отправки формы заказа: повторная отправка возвращает уже созданный заказ
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'orders_idempotency_key_uq') THEN
+        ALTER TABLE orders ADD CONSTRAINT orders_idempotency_key_uq UNIQUE (id_user, idempotency_key);
+    END IF;
+END $$;
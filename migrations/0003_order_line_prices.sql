@@ -0,0 +1,20 @@
+-- Цена товара на момент заказа в строках заказа.
+-- Существующие строки получают текущую цену товара.
+ALTER TABLE "product-order" ADD COLUMN IF NOT EXISTS price DECIMAL;
+ALTER TABLE "stock-order" ADD COLUMN IF NOT EXISTS price_order DECIMAL;
+
+UPDATE "product-order" po
+SET price = p.price_product
+FROM products p
+WHERE po.id_product = p.id_product
+  AND po.price IS NULL;
+
+UPDATE "stock-order" so
+SET price_order = p.price_product
+FROM stocks s
+JOIN products p ON p.id_product = s.id_product
+WHERE so.id_stock = s.id_stock
+  AND so.price_order IS NULL;
+
+ALTER TABLE "product-order" ALTER COLUMN price SET NOT NULL;
+ALTER TABLE "stock-order" ALTER COLUMN price_order SET NOT NULL;
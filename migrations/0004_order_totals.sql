@@ -0,0 +1,14 @@
+-- Денормализованные итоги заказа. Итоги всех заказов считаются по строкам с ценами
+-- из 0003; разошедшиеся потом итоги пересчитывает repair_order_totals.py.
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS total_amount DECIMAL NOT NULL DEFAULT 0;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS line_count INT4 NOT NULL DEFAULT 0;
+
+UPDATE orders o
+SET total_amount = coalesce(po.total, 0) + coalesce(so.total, 0),
+    line_count = coalesce(po.lines, 0) + coalesce(so.lines, 0)
+FROM orders base
+LEFT JOIN (SELECT id_order, SUM(count * price) AS total, COUNT(*) AS lines
+           FROM "product-order" GROUP BY id_order) po ON po.id_order = base.id_order
+LEFT JOIN (SELECT id_order, SUM(count_order * price_order) AS total, COUNT(*) AS lines
+           FROM "stock-order" GROUP BY id_order) so ON so.id_order = base.id_order
+WHERE o.id_order = base.id_order;
@@ -0,0 +1,5 @@
+-- Версия истории покупателя, при которой заказ создан или сменил статус:
+-- опрос /orders/status отдаёт только заказы новее версии клиента
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS history_version INT4 NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS orders_user_history_idx ON orders (id_user, history_version);
@@ -0,0 +1,14 @@
+-- Хранимый срок годности партии: date_stock + expiration_month_product товара.
+-- Пересчитывается приложением при приходе партии и при смене срока годности товара.
+ALTER TABLE stocks ADD COLUMN IF NOT EXISTS expires_at_stock DATE;
+
+UPDATE stocks s
+SET expires_at_stock = (s.date_stock + make_interval(months => p.expiration_month_product))::date
+FROM products p
+WHERE p.id_product = s.id_product
+  AND s.expires_at_stock IS NULL;
+
+ALTER TABLE stocks ALTER COLUMN expires_at_stock SET NOT NULL;
+
+-- Партии в наличии по сроку годности (просроченные и истекающие партии)
+CREATE INDEX IF NOT EXISTS stocks_expires_idx ON stocks (expires_at_stock) WHERE count_stock > 0;
@@ -0,0 +1,14 @@
+-- Одна партия на товар + RAL + дату производства: ключ слияния при импорте остатков
+-- (INSERT ... ON CONFLICT). RAL NULL и пустой считаются одним значением.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM stocks
+        GROUP BY id_product, coalesce(ral_stock, ''), date_stock
+        HAVING count(*) > 1
+    ) THEN
+        RAISE EXCEPTION 'stocks: есть дубли партий (товар, RAL, дата) - объедините их перед миграцией';
+    END IF;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS stocks_batch_uq ON stocks (id_product, (coalesce(ral_stock, '')), date_stock);
@@ -0,0 +1,23 @@
+-- Журнал движений по партиям и снимки остатков
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id_movement SERIAL NOT NULL,
+    id_stock INT4 NOT NULL REFERENCES stocks (id_stock),
+    kind_movement VARCHAR(16) NOT NULL,
+    quantity_movement INT4 NOT NULL,
+    id_order INT4 NULL REFERENCES orders (id_order),
+    note_movement TEXT NULL,
+    created_at_movement TIMESTAMP NOT NULL DEFAULT now(),
+    CONSTRAINT PK_STOCK_MOVEMENTS PRIMARY KEY (id_movement),
+    CONSTRAINT CKC_KIND_MOVEMENT CHECK (kind_movement IN ('receipt', 'reservation', 'shipment', 'correction'))
+);
+
+CREATE INDEX IF NOT EXISTS stock_movements_stock_idx ON stock_movements (id_stock, id_movement);
+CREATE INDEX IF NOT EXISTS stock_movements_created_idx ON stock_movements (created_at_movement);
+
+CREATE TABLE IF NOT EXISTS stock_snapshots (
+    id_stock INT4 NOT NULL REFERENCES stocks (id_stock),
+    id_movement INT4 NOT NULL,
+    balance_snapshot INT4 NOT NULL,
+    created_at_snapshot TIMESTAMP NOT NULL DEFAULT now(),
+    CONSTRAINT PK_STOCK_SNAPSHOTS PRIMARY KEY (id_stock, id_movement)
+);
@@ -0,0 +1,13 @@
+-- События заказов для фоновой обработки (outbox)
+CREATE TABLE IF NOT EXISTS outbox_events (
+    id_event SERIAL NOT NULL,
+    kind_event VARCHAR(64) NOT NULL,
+    payload_event JSON NOT NULL,
+    created_at_event TIMESTAMP NOT NULL DEFAULT now(),
+    processed_at_event TIMESTAMP NULL,
+    attempts_event INT4 NOT NULL DEFAULT 0,
+    error_event TEXT NULL,
+    CONSTRAINT PK_OUTBOX_EVENTS PRIMARY KEY (id_event)
+);
+
+CREATE INDEX IF NOT EXISTS outbox_events_pending_idx ON outbox_events (id_event) WHERE processed_at_event IS NULL;
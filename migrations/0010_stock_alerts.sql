@@ -0,0 +1,17 @@
+-- Минимальный остаток товара и предупреждения периодического сканера остатков
+ALTER TABLE products ADD COLUMN IF NOT EXISTS reorder_threshold_product INT4 NOT NULL DEFAULT 10;
+
+CREATE TABLE IF NOT EXISTS stock_alerts (
+    id_alert SERIAL NOT NULL,
+    kind_alert VARCHAR(16) NOT NULL,
+    id_product INT4 NOT NULL REFERENCES products (id_product),
+    id_stock INT4 NULL REFERENCES stocks (id_stock),
+    quantity_alert INT4 NOT NULL,
+    threshold_alert INT4 NULL,
+    expires_at_alert DATE NULL,
+    scanned_at_alert TIMESTAMP NOT NULL DEFAULT now(),
+    CONSTRAINT PK_STOCK_ALERTS PRIMARY KEY (id_alert),
+    CONSTRAINT CKC_KIND_ALERT CHECK (kind_alert IN ('expired', 'expiring', 'low_stock'))
+);
+
+CREATE INDEX IF NOT EXISTS stock_alerts_kind_idx ON stock_alerts (kind_alert);
@@ -0,0 +1,34 @@
+-- product_stock_series становится материализованным представлением: подписи партий
+-- считаются при обновлении, а не на каждый запрос. Обновляет воркер outbox
+-- (REFRESH ... CONCURRENTLY) после транзакций с движениями остатков.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_views WHERE schemaname = 'public' AND viewname = 'product_stock_series') THEN
+        DROP VIEW public.product_stock_series;
+    END IF;
+END $$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.product_stock_series AS
+ SELECT s.id_stock,
+    s.id_product,
+    p.title_product,
+    p.nomenclature_product,
+    s.ral_stock,
+    s.date_stock,
+    s.expires_at_stock,
+    concat(p.nomenclature_product,
+        CASE
+            WHEN (s.ral_stock IS NOT NULL) THEN concat(' RAL ', s.ral_stock)
+            ELSE ''::text
+        END) AS nomenclature_ral,
+    s.count_stock AS remaining_quantity
+   FROM (public.stocks s
+     JOIN public.products p ON ((s.id_product = p.id_product)))
+  WHERE (s.count_stock > 0);
+
+-- Уникальный индекс обязателен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS product_stock_series_stock_uq ON public.product_stock_series (id_stock);
+-- Партии по сроку годности (фильтр min_days)
+CREATE INDEX IF NOT EXISTS product_stock_series_expires_idx ON public.product_stock_series (expires_at_stock);
+-- Страницы склада покупателя: keyset по товарам (title_product, id_product)
+CREATE INDEX IF NOT EXISTS product_stock_series_title_idx ON public.product_stock_series (title_product, id_product);
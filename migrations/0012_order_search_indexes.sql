@@ -0,0 +1,10 @@
+-- Поиск заказов: триграммы для ILIKE по компании и товару, btree для RAL, статуса и периода
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS users_company_trgm_idx ON users USING gin (company_name_user gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS products_nomenclature_trgm_idx ON products USING gin (nomenclature_product gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS products_title_trgm_idx ON products USING gin (title_product gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS product_order_ral_idx ON "product-order" (ral, id_order);
+CREATE INDEX IF NOT EXISTS stocks_ral_idx ON stocks (ral_stock);
+CREATE INDEX IF NOT EXISTS orders_status_date_idx ON orders (status_order, created_at_order DESC, id_order DESC);
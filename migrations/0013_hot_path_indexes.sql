@@ -0,0 +1,20 @@
+-- migrate: no-transaction
+-- Индексы горячих запросов; CONCURRENTLY, чтобы не блокировать запись в таблицы.
+-- Если построение прервалось, индекс остаётся INVALID: удалите его и запустите миграцию снова.
+
+-- Партии товара по RAL и дате (поиск партии при приходе, остатки товара)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS stocks_product_ral_date_idx ON stocks (id_product, ral_stock, date_stock);
+-- Автоподбор партий FEFO по хранимому сроку годности
+CREATE INDEX CONCURRENTLY IF NOT EXISTS stocks_fefo_expiry_idx ON stocks (id_product, ral_stock, expires_at_stock, date_stock, id_stock) WHERE count_stock > 0;
+-- Партии в наличии (склад покупателя, представление product_stock_series)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS stocks_in_stock_idx ON stocks (count_stock) WHERE count_stock > 0;
+
+-- История заказов покупателя по дате
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_user_created_idx ON orders (id_user, created_at_order);
+-- Заказы по статусу за период: (status_order, created_at_order) уже покрыт orders_status_date_idx из 0012
+
+-- Пользователи по роли (списки покупателей и менеджеров)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_role_idx ON users (role_user);
+
+-- Товар по номенклатуре (корзина, приход партий)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS products_nomenclature_idx ON products (nomenclature_product);
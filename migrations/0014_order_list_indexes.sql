@@ -0,0 +1,15 @@
+-- migrate: no-transaction
+-- Индексы списков заказов админа и менеджера (сортировка, keyset-пагинация);
+-- CONCURRENTLY, чтобы не блокировать запись.
+-- Если построение прервалось, индекс остаётся INVALID: удалите его и запустите миграцию снова.
+
+-- Сортировка по дате
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_created_at_idx ON orders (created_at_order DESC, id_order DESC);
+-- Сортировка по статусу: выражение совпадает с порядком статусов в order_projection
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_status_rank_idx ON orders ((CASE status_order WHEN 'pending_moderation' THEN 0 WHEN 'approved' THEN 1 WHEN 'completed' THEN 2 WHEN 'cancelled' THEN 3 ELSE 4 END), id_order);
+-- Сортировка по сумме заказа (итоги из 0004)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_total_idx ON orders (total_amount DESC, id_order DESC);
+-- Заказы покупателя по порядку
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "user-order_id_FK" ON orders (id_user, id_order);
+-- Сортировка по компании
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_company_name_idx ON users (lower(company_name_user), id_user);
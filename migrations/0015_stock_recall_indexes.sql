@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- Отчёт для отзыва партии: связка "stock-order" читается только из индексов.
+-- Если построение прервалось, индекс остаётся INVALID: удалите его и запустите миграцию снова.
+
+-- Партия -> заказы (PK (id_stock, id_order) не содержит количество и цену)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS stock_order_stock_cover_idx ON "stock-order" (id_stock) INCLUDE (id_order, count_order, price_order);
+-- Заказ -> партии (строки заказа из остатков)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS stock_order_order_cover_idx ON "stock-order" (id_order) INCLUDE (id_stock, count_order, price_order);
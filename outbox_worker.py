@@ -0,0 +1,13 @@
+import logging
+from app import create_app
+from app.outbox import run_outbox_worker
+
+logging.basicConfig(level=logging.INFO)
+
+app = create_app(background_workers=False)
+
+# Standalone worker for order side effects and product_stock_series refreshes.
+# Required when the app runs with OUTBOX_WORKER=0 (otherwise stock pages never
+# refresh); several copies may run side by side
+if __name__ == '__main__':
+    run_outbox_worker(app)
@@ -0,0 +1,15 @@
+import sys
+from app import create_app
+from app.models import db
+from app.db_helpers import refresh_order_totals
+
+app = create_app(background_workers=False)
+
+# Usage: python repair_order_totals.py            recalculate total_amount / line_count of every order
+#        python repair_order_totals.py 12 15 ...  only the given orders (e.g. after a manual fix of their lines)
+# The columns themselves come from migration 0004_order_totals.sql
+with app.app_context():
+    order_ids = [int(arg) for arg in sys.argv[1:]] or None
+    updated = refresh_order_totals(order_ids)
+    db.session.commit()
+    print(f"Order totals recalculated for {updated} orders")
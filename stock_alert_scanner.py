@@ -0,0 +1,17 @@
+import logging
+import sys
+from app import create_app
+from app.stock_alerts import run_stock_alert_scanner, scan_stock_alerts
+
+logging.basicConfig(level=logging.INFO)
+
+app = create_app(background_workers=False)
+
+# Standalone expiry / low-stock scanner, needed when the app runs with STOCK_ALERT_SCANNER=0;
+# with --once runs a single pass (e.g. from cron)
+if __name__ == '__main__':
+    if '--once' in sys.argv:
+        with app.app_context():
+            print(f"Stock alerts: {scan_stock_alerts()}")
+    else:
+        run_stock_alert_scanner(app)
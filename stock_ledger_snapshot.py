@@ -0,0 +1,20 @@
+from app import create_app
+from app.models import db
+from app.stock_ledger import record_opening_balances, take_snapshots, find_balance_mismatches
+
+app = create_app(background_workers=False)
+
+# Run periodically (e.g. hourly from cron): balance = last snapshot + movements after it
+with app.app_context():
+    # Batches that predate the ledger get an opening correction equal to count_stock
+    opened = record_opening_balances()
+    db.session.commit()
+    if opened:
+        print(f"Opening balances recorded for {opened} stock batches")
+
+    created = take_snapshots()
+    db.session.commit()
+    print(f"Stock balance snapshots taken for {created} stock batches")
+
+    for id_stock, count_stock, balance in find_balance_mismatches():
+        print(f"Mismatch: stock {id_stock} count_stock={count_stock} ledger={balance}")
@@ -0,0 +1,120 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тесты работают на SQLite в памяти, если не задана своя база
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from app.models import db, User, Product, Stock, Order, ProductOrder, StockOrder
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app(background_workers=False)
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def session(app):
+    """Чистая схема на каждый тест"""
+    with app.app_context():
+        db.create_all()
+        yield db.session
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def pg_db():
+    """Схема с каталогом (add_catalog) в PostgreSQL из TEST_DATABASE_URL.
+
+    Для кода, который работает только на PostgreSQL (COPY, ARRAY); без базы тест пропускается.
+    """
+    url = os.environ.get('TEST_DATABASE_URL', '')
+    if not url.startswith('postgresql'):
+        pytest.skip('нужна TEST_DATABASE_URL с PostgreSQL')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        add_catalog()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def catalog(session):
+    """Схема с каталогом add_catalog"""
+    add_catalog()
+
+
+@pytest.fixture
+def client_as(app, session):
+    """Тестовый клиент с пользователем заданной роли в сессии"""
+    def make_client(role, user_id=1):
+        client = app.test_client()
+        with client.session_transaction() as flask_session:
+            flask_session['user'] = {'id': user_id, 'name': 'test', 'role': role, 'email': 'test@example.com'}
+        return client
+    return make_client
+
+
+class QueryCounter:
+    """Считает SQL-операторы, выполненные движком внутри блока with"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+@pytest.fixture
+def count_queries(session):
+    return lambda: QueryCounter(db.engine)
+
+
+def add_catalog():
+    """Покупатель, менеджер, товар и партия для заказов"""
+    db.session.add_all([
+        User(id_user=1, email_user='buyer@example.com', fullname_user='Покупатель', inn_user='1',
+             company_name_user='ООО Покупатель', phone_user='1', password_hash_user='x:y', role_user='buyer'),
+        User(id_user=2, email_user='manager@example.com', fullname_user='Менеджер', inn_user='1',
+             company_name_user='Праймтоп', phone_user='1', password_hash_user='x:y', role_user='manager'),
+        Product(id_product=1, title_product='Эмаль', price_product=100, category_product='Эмали',
+                description_product='', expiration_month_product=12, nomenclature_product='ЭМ-1 RAL 7024'),
+    ])
+    db.session.add(Stock(id_stock=1, id_product=1, count_stock=1000, ral_stock='7024',
+                         date_stock=date(2025, 1, 1), expires_at_stock=date(2026, 1, 1)))
+    db.session.commit()
+
+
+def add_orders(count, user_id=1):
+    """count заказов покупателя, в каждом строка производства и строка из остатков"""
+    for _ in range(count):
+        order = Order(id_user=user_id, status_order='pending_moderation',
+                      created_at_order=date(2025, 2, 1), total_amount=500, line_count=2)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(ProductOrder(id_product=1, id_order=order.id_order, count=2, ral='7024',
+                                    creating_date=date(2025, 2, 1), price=100))
+        db.session.add(StockOrder(id_stock=1, id_order=order.id_order, count_order=3, price_order=100))
+    db.session.commit()
@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip('pandas')
+
+from app.analytics import get_sales_trends
+from app.models import db, Order
+from conftest import add_orders
+
+
+def test_category_revenue_includes_stock_lines(catalog):
+    add_orders(2)
+    Order.query.update({Order.status_order: 'approved'})
+    db.session.commit()
+
+    revenue = get_sales_trends()['data']['datasets'][0]['data']
+    category_revenue = get_sales_trends(category='Эмали')['data']['datasets'][0]['data']
+    assert [float(value) for value in category_revenue] == [float(value) for value in revenue] == [1000.0]
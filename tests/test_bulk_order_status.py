@@ -0,0 +1,23 @@
+from app.db_helpers import create_order, update_order_status, bulk_update_order_status
+from app.models import db, Order, Stock
+
+
+def _order(qty):
+    return create_order(1, {'1_7024_1': {'qty': qty, 'ral': '7024', 'product_id': '1', 'id_stock': '1'}}).id_order
+
+
+def test_bulk_approve_skips_only_orders_without_stock(pg_db):
+    # Запрос по id через ARRAY - только PostgreSQL
+    short, enough = _order(600), _order(100)
+    update_order_status(short, 'cancelled')
+    update_order_status(enough, 'cancelled')
+    pending = _order(500)
+
+    results, errors = bulk_update_order_status([short, enough, pending, 999999], 'approved')
+
+    assert results == {short: 'out_of_stock', enough: 'updated', pending: 'updated', 999999: 'not_found'}
+    assert list(errors) == [short]
+    db.session.expire_all()
+    assert {order.id_order: order.status_order for order in Order.query} == \
+        {short: 'cancelled', enough: 'approved', pending: 'approved'}
+    assert db.session.get(Stock, 1).count_stock == 400
@@ -0,0 +1,32 @@
+import threading
+
+import pytest
+
+from app import utils
+
+
+@pytest.fixture
+def chats_dir(tmp_path, monkeypatch):
+    chats = tmp_path / 'chats'
+    chats.mkdir()
+    monkeypatch.setattr(utils, 'CHATS', str(chats))
+    monkeypatch.setattr(utils, 'CHAT_ASSIGNMENTS', tmp_path / 'chat_assignments.json')
+    monkeypatch.setattr(utils, 'CHAT_ASSIGNMENTS_LOCK', tmp_path / 'chat_assignments.lock')
+    return chats
+
+
+def test_concurrent_assignments_are_not_lost(chats_dir):
+    threads = [threading.Thread(target=utils.set_chat_assignment, args=(user_id, 100 + user_id))
+               for user_id in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert utils.get_chat_assignments() == {str(user_id): 100 + user_id for user_id in range(50)}
+
+
+def test_corrupted_index_is_rebuilt_from_chats(chats_dir):
+    utils.write_json(chats_dir / '7.json', {'assigned_manager': 2})
+    utils.CHAT_ASSIGNMENTS.write_text('{"7": 2, "8"', encoding='utf-8')
+    assert utils.get_chat_assignments() == {'7': 2}
+    assert utils.read_json(utils.CHAT_ASSIGNMENTS) == {'7': 2}
@@ -0,0 +1,45 @@
+import pytest
+
+from app.db_helpers import create_order, refresh_order_totals
+from app.models import db, Order, Product, Stock, StockOrder
+
+
+@pytest.fixture
+def primer(catalog):
+    """Второй товар каталога"""
+    db.session.add(Product(id_product=2, title_product='Грунт', price_product=10, category_product='Грунты',
+                           description_product='', expiration_month_product=6, nomenclature_product='ГР-1'))
+    db.session.commit()
+
+
+def test_stock_line_price_comes_from_the_batch_product(catalog):
+    order = create_order(1, {'1_7024_1': {'qty': 2, 'ral': '7024', 'product_id': '1', 'id_stock': '1'}})
+    line = StockOrder.query.filter_by(id_order=order.id_order).one()
+    assert line.price_order == 100
+    assert order.total_amount == 200
+
+
+def test_stock_line_of_another_product_is_rejected(primer):
+    order = create_order(1, {'2__1': {'qty': 2, 'ral': '', 'product_id': '2', 'id_stock': '1'}})
+    assert StockOrder.query.filter_by(id_order=order.id_order).count() == 0
+    assert db.session.get(Stock, 1).count_stock == 1000
+
+
+def test_add_to_cart_rejects_batch_of_another_product(primer, client_as):
+    client = client_as('buyer')
+    response = client.post('/add_to_cart', data={'product_id': '2', 'qty': '1', 'id_stock': '1'})
+    assert response.status_code == 302
+    with client.session_transaction() as flask_session:
+        assert not flask_session.get('cart')
+
+
+def test_refresh_order_totals_repairs_drifted_orders(catalog):
+    order = create_order(1, {'1_7024_1': {'qty': 2, 'ral': '7024', 'product_id': '1', 'id_stock': '1'}})
+    # Ручная правка строки заказа мимо приложения
+    StockOrder.query.filter_by(id_order=order.id_order).update({StockOrder.count_order: 5})
+    db.session.commit()
+
+    assert refresh_order_totals([order.id_order]) == 1
+    db.session.commit()
+    order = db.session.get(Order, order.id_order)
+    assert (order.total_amount, order.line_count) == (500, 1)
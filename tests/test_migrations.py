@@ -0,0 +1,31 @@
+import re
+
+from app.migrations import NO_TRANSACTION_MARKER, _split_statements, list_migrations
+
+
+def test_migration_versions_are_contiguous():
+    versions = [int(version) for version, _ in list_migrations()]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_order_columns_are_added_before_indexes_that_use_them():
+    names = [path.name for _, path in list_migrations()]
+    prices = names.index('0003_order_line_prices.sql')
+    assert prices < names.index('0004_order_totals.sql') < names.index('0014_order_list_indexes.sql')
+    assert prices < names.index('0015_stock_recall_indexes.sql')
+    assert names.index('0006_stock_expiry.sql') < names.index('0011_product_stock_series.sql')
+    assert names.index('0006_stock_expiry.sql') < names.index('0013_hot_path_indexes.sql')
+
+
+def test_no_index_is_created_and_then_dropped():
+    sql = '\n'.join(path.read_text(encoding='utf-8') for _, path in list_migrations())
+    assert not re.search(r'DROP\s+INDEX', sql, re.IGNORECASE)
+
+
+def test_no_transaction_migrations_split_into_single_statements():
+    for _, path in list_migrations():
+        sql = path.read_text(encoding='utf-8')
+        if NO_TRANSACTION_MARKER in sql:
+            assert '$$' not in sql, path.name
+            for statement in _split_statements(sql):
+                assert statement.split()[0].upper() == 'CREATE', path.name
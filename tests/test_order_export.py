@@ -0,0 +1,34 @@
+import pytest
+
+from app.order_export import count_export_lines, generate_csv
+from conftest import add_orders
+
+
+@pytest.fixture
+def orders(catalog):
+    add_orders(3)
+
+
+def test_csv_export_streams_every_line(orders):
+    assert count_export_lines() == 6
+    lines = ''.join(generate_csv()).splitlines()
+    assert len(lines) == 7
+    # Строки обоих типов слиты по заказу: производство, затем остатки
+    assert [line.split(';')[:1] + line.split(';')[5:6] for line in lines[1:]] == \
+        [[str(id_order), kind] for id_order in (1, 2, 3) for kind in ('Производство', 'Остатки')]
+
+
+def test_large_xlsx_export_is_refused(orders, client_as, monkeypatch):
+    monkeypatch.setattr('app.routes.admin.XLSX_MAX_ROWS', 5)
+    response = client_as('admin').get('/admin/orders/export?format=xlsx')
+    assert response.status_code == 302
+    response = client_as('admin').get('/admin/orders/export?format=csv')
+    assert response.status_code == 200
+    assert len(response.get_data(as_text=True).splitlines()) == 7
+
+
+def test_small_xlsx_export_is_streamed(orders, client_as):
+    pytest.importorskip('openpyxl')
+    response = client_as('admin').get('/admin/orders/export?format=xlsx')
+    assert response.status_code == 200
+    assert response.get_data()[:2] == b'PK'
@@ -0,0 +1,35 @@
+from app.db_helpers import create_order, update_order_status
+from app.models import db, OrderHistoryVersion
+from app.order_cache import bump_order_history_versions, get_order_history_version
+from conftest import add_orders
+
+
+def _order(qty=1):
+    return create_order(1, {'1_7024': {'qty': qty, 'ral': '7024', 'product_id': '1'}})
+
+
+def test_bump_creates_then_increments_version(catalog):
+    assert bump_order_history_versions([1, 2, 1]) == {1: 1, 2: 1}
+    assert bump_order_history_versions([1]) == {1: 2}
+    db.session.commit()
+    assert db.session.get(OrderHistoryVersion, 1).version == 2
+
+
+def test_status_poll_returns_only_changed_orders(catalog, client_as):
+    add_orders(3)
+    first = _order()
+    second = _order()
+    client = client_as('buyer')
+
+    version = get_order_history_version(1)
+    assert client.get(f'/orders/status?since={version}').get_json()['changed'] is False
+
+    update_order_status(first.id_order, 'approved')
+    data = client.get(f'/orders/status?since={version}').get_json()
+    assert data['changed'] is True
+    assert data['version'] == version + 1
+    assert data['orders'] == [{'id': f'order_{first.id_order}', 'status': 'approved'}]
+
+    data = client.get('/orders/status').get_json()
+    assert len(data['orders']) == 5
+    assert second.history_version == version
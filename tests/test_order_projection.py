@@ -0,0 +1,43 @@
+import pytest
+
+from app.models import db
+from app.order_projection import get_admin_orders_page, get_manager_orders_page, get_order_views
+from conftest import add_orders
+
+
+def _queries(count_queries, load):
+    db.session.expire_all()
+    with count_queries() as counter:
+        load()
+    return counter.count
+
+
+def test_order_views_query_count_does_not_grow(catalog, count_queries):
+    add_orders(3)
+    few = _queries(count_queries, get_order_views)
+    add_orders(30)
+    many = _queries(count_queries, get_order_views)
+    assert len(get_order_views()) == 33
+    assert few == many
+
+
+@pytest.mark.parametrize('load_page', [get_admin_orders_page, get_manager_orders_page])
+def test_order_pages_query_count_does_not_depend_on_page_size(catalog, count_queries, load_page):
+    add_orders(40)
+    small = _queries(count_queries, lambda: load_page(per_page=5))
+    large = _queries(count_queries, lambda: load_page(per_page=40))
+    orders_data, _ = load_page(per_page=40)
+    assert len(orders_data) == 40
+    assert small == large
+
+
+@pytest.mark.parametrize('role, url', [('admin', '/admin/orders'), ('manager', '/manager/orders')])
+def test_order_list_routes_query_count_is_constant(catalog, client_as, count_queries, role, url):
+    client = client_as(role)
+    add_orders(2)
+    with count_queries() as few:
+        assert client.get(url).status_code == 200
+    add_orders(18)
+    with count_queries() as many:
+        assert client.get(url).status_code == 200
+    assert few.count == many.count
@@ -0,0 +1,31 @@
+import time
+
+from app import outbox
+from app.models import OutboxEvent
+
+KIND = 'test_debounced'
+
+
+def test_debounced_kind_is_deferred_outside_batch_transaction(session, monkeypatch):
+    calls = []
+    monkeypatch.setattr(outbox, '_handlers', {})
+    monkeypatch.setattr(outbox, '_min_intervals', {})
+    monkeypatch.setattr(outbox, '_last_processed', {})
+    outbox.register_handler(KIND, calls.append, min_interval=60)
+
+    outbox.enqueue_events(KIND, [{'n': 1}, {'n': 2}])
+    session.commit()
+    assert outbox.process_outbox_batch() == 2
+    assert calls == [[{'n': 1}, {'n': 2}]]
+
+    # Пауза не прошла: события не выбираются и не блокируются, обработчик не ждёт
+    outbox.enqueue_event(KIND, {'n': 3})
+    session.commit()
+    started = time.monotonic()
+    assert outbox.process_outbox_batch() == 0
+    assert time.monotonic() - started < 1
+    assert OutboxEvent.query.filter(OutboxEvent.processed_at_event.is_(None)).count() == 1
+
+    outbox._last_processed[KIND] -= 60
+    assert outbox.process_outbox_batch() == 1
+    assert calls[-1] == [{'n': 3}]
@@ -0,0 +1,22 @@
+from datetime import date
+
+from app.models import db, Product, Stock
+from app.stock_alerts import scan_stock_alerts, get_stock_alerts, ALERT_EXPIRED, ALERT_EXPIRING, ALERT_LOW_STOCK
+
+
+def test_low_stock_only_for_products_that_had_batches(catalog):
+    db.session.add_all([
+        # Товар под заказ: партий не было никогда
+        Product(id_product=2, title_product='Грунт', price_product=10, category_product='Грунты',
+                description_product='', expiration_month_product=6, nomenclature_product='ГР-1'),
+        # Годный остаток кончился
+        Product(id_product=3, title_product='Лак', price_product=10, category_product='Лаки',
+                description_product='', expiration_month_product=6, nomenclature_product='ЛК-1'),
+        Stock(id_stock=3, id_product=3, count_stock=0, ral_stock=None,
+              date_stock=date(2025, 1, 1), expires_at_stock=date(2025, 7, 1)),
+    ])
+    db.session.commit()
+
+    counts = scan_stock_alerts(today=date(2025, 6, 1))
+    assert counts == {ALERT_EXPIRED: 0, ALERT_EXPIRING: 0, ALERT_LOW_STOCK: 1}
+    assert [(alert['kind'], alert['id_product']) for alert in get_stock_alerts()] == [(ALERT_LOW_STOCK, 3)]
@@ -0,0 +1,53 @@
+from datetime import date
+
+import pytest
+
+from app.db_helpers import create_order, OutOfStockError
+from app.models import db, Product, Stock
+from app.stock_allocation import plan_fefo
+
+
+@pytest.fixture
+def product(catalog):
+    # Партия, произведённая позже, истекает раньше (срок годности пересчитан вручную)
+    db.session.add_all([
+        Stock(id_stock=2, id_product=1, count_stock=10, ral_stock='7024',
+              date_stock=date(2025, 3, 1), expires_at_stock=date(2025, 9, 1)),
+        Stock(id_stock=3, id_product=1, count_stock=10, ral_stock='7024',
+              date_stock=date(2024, 1, 1), expires_at_stock=date(2024, 6, 1)),
+    ])
+    db.session.commit()
+    return db.session.get(Product, 1)
+
+
+def test_plan_takes_earliest_expiry_first(product):
+    assert plan_fefo(product, '7024', 15, today=date(2025, 1, 1)) == [(2, 10), (1, 5)]
+
+
+def test_plan_skips_batches_outside_shelf_life_filter(product):
+    # Партия 2 годна ещё 243 дня от 2025-01-01, партия 1 - 365
+    assert plan_fefo(product, '7024', 15, min_days=300, today=date(2025, 1, 1)) == [(1, 15)]
+
+
+def test_fefo_cart_line_keeps_shelf_life_filter(product, client_as):
+    client = client_as('buyer')
+    client.post('/add_to_cart', data={'product_id': '1', 'ral': '7024', 'qty': '2', 'allocate': 'fefo', 'min_days': '90'})
+    with client.session_transaction() as flask_session:
+        assert flask_session['cart']['1_7024_fefo']['min_days'] == 90
+
+
+def test_fefo_shortage_label_names_ral_once(product):
+    cart = {'1_7024_fefo': {'qty': 5000, 'ral': '7024', 'product_id': '1', 'allocate': 'fefo'}}
+    with pytest.raises(OutOfStockError) as error:
+        create_order(1, cart)
+    assert str(error.value).startswith('ЭМ-1 RAL 7024: запрошено 5000')
+
+
+def test_stock_page_has_one_fefo_control_per_product(product, client_as, monkeypatch):
+    groups = [{'id_product': 1, 'title': 'Эмаль', 'nomenclature': 'ЭМ-1', 'total_quantity': 20, 'batches': [
+        {'id_stock': id_stock, 'nomenclature_ral': 'ЭМ-1 RAL 7024', 'ral': '7024', 'date_stock': date(2025, 1, 1),
+         'expires_at_stock': date(2026, 1, 1), 'remaining_quantity': 10} for id_stock in (1, 2)]}]
+    monkeypatch.setattr('app.routes.buyer.get_stock_products_page', lambda *args, **kwargs: (groups, None))
+    html = client_as('buyer').get('/stock').get_data(as_text=True)
+    assert html.count('name="allocate" value="fefo"') == 1
+    assert html.count('name="id_stock"') == 2
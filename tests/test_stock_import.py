@@ -0,0 +1,37 @@
+import io
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from werkzeug.datastructures import FileStorage
+
+from app.models import db, Stock, StockMovement
+from app.stock_import import import_stock_file
+from app.stock_ledger import record_opening_balances, find_balance_mismatches
+
+
+@pytest.fixture
+def import_db(pg_db):
+    """Импорт идёт через COPY и ON CONFLICT по stocks_batch_uq, поэтому проверяется только на PostgreSQL"""
+    db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS stocks_batch_uq "
+                            "ON stocks (id_product, (coalesce(ral_stock, '')), date_stock)"))
+    db.session.commit()
+
+
+def test_import_into_batch_with_empty_ral_writes_receipt(import_db):
+    # Старая партия хранит пустой RAL как '', в файле пустой RAL становится NULL
+    db.session.add(Stock(id_stock=2, id_product=1, count_stock=10, ral_stock='',
+                         date_stock=date(2025, 3, 1), expires_at_stock=date(2026, 3, 1)))
+    db.session.commit()
+    record_opening_balances()
+    db.session.commit()
+
+    upload = FileStorage(io.BytesIO('nomenclature,ral,date,qty\nЭМ-1 RAL 7024,,01.03.2025,5\n'.encode('utf-8')),
+                         filename='stock.csv')
+    report = import_stock_file(upload)
+
+    assert (report['created'], report['updated']) == (0, 1)
+    assert db.session.get(Stock, 2).count_stock == 15
+    assert [movement.quantity_movement for movement in
+            StockMovement.query.filter_by(id_stock=2, kind_movement='receipt')] == [5]
+    assert find_balance_mismatches() == []
@@ -0,0 +1,75 @@
+import pytest
+
+from app.db_helpers import create_order, update_order_status, OutOfStockError
+from app.models import db, Stock, StockMovement
+from app.stock_ledger import get_stock_balances, record_opening_balances, take_snapshots
+
+
+@pytest.fixture
+def order(catalog):
+    record_opening_balances()
+    db.session.commit()
+    return create_order(1, {'1_7024_1': {'qty': 30, 'ral': '7024', 'product_id': '1', 'id_stock': '1'}})
+
+
+def _movements(id_order):
+    return [(movement.kind_movement, movement.quantity_movement)
+            for movement in StockMovement.query.filter_by(id_order=id_order).order_by(StockMovement.id_movement)]
+
+
+def _count_stock():
+    db.session.expire_all()
+    return db.session.get(Stock, 1).count_stock
+
+
+def test_completed_order_turns_reservation_into_shipment(order):
+    update_order_status(order.id_order, 'approved')
+    update_order_status(order.id_order, 'completed')
+    assert _movements(order.id_order) == [('reservation', -30), ('reservation', 30), ('shipment', -30)]
+    assert _count_stock() == 970
+    assert get_stock_balances([1]) == {1: 970}
+
+
+@pytest.mark.parametrize('status', ['cancelled', 'rejected'])
+def test_cancelled_or_rejected_order_returns_stock(order, status):
+    update_order_status(order.id_order, status)
+    assert _movements(order.id_order) == [('reservation', -30), ('reservation', 30)]
+    assert _count_stock() == 1000
+    assert get_stock_balances([1]) == {1: 1000}
+
+
+def test_reopening_order_reserves_again_or_fails(order):
+    update_order_status(order.id_order, 'cancelled')
+    update_order_status(order.id_order, 'approved')
+    assert _count_stock() == 970
+
+    update_order_status(order.id_order, 'cancelled')
+    db.session.get(Stock, 1).count_stock = 10
+    db.session.commit()
+    with pytest.raises(OutOfStockError):
+        update_order_status(order.id_order, 'approved')
+    assert _count_stock() == 10
+
+
+def test_snapshot_plus_tail_equals_balance(order):
+    assert take_snapshots() == 1
+    db.session.commit()
+    update_order_status(order.id_order, 'cancelled')
+    assert get_stock_balances([1]) == {1: 1000}
+    assert take_snapshots() == 1
+    assert get_stock_balances([1]) == {1: 1000}
+
+
+def test_admin_receipt_adds_to_existing_batch(order, client_as):
+    client = client_as('admin')
+    client.post('/admin/stocks', data={'nomenclature': 'ЭМ-1 RAL 7024', 'qty': '50', 'ral': '7024', 'date': '2025-01-01'})
+    assert _count_stock() == 1020
+    assert get_stock_balances([1]) == {1: 1020}
+
+
+@pytest.mark.parametrize('qty', ['0', '-5', 'abc'])
+def test_admin_receipt_rejects_non_positive_quantity(order, client_as, qty):
+    client = client_as('admin')
+    client.post('/admin/stocks', data={'nomenclature': 'ЭМ-1 RAL 7024', 'qty': qty, 'ral': '7024', 'date': '2025-01-01'})
+    assert _count_stock() == 970
+    assert StockMovement.query.filter_by(kind_movement='receipt').count() == 0
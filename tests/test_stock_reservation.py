@@ -0,0 +1,102 @@
+import os
+import threading
+from datetime import date, timedelta
+
+import pytest
+from flask import Flask
+
+from app.db_helpers import create_order, reserve_stocks, OutOfStockError
+from app.models import db, Stock
+from app.stock_allocation import try_reserve_stock
+from conftest import add_catalog
+
+
+def test_non_positive_quantity_is_not_reserved(catalog):
+    with pytest.raises(ValueError):
+        try_reserve_stock(1, -5)
+    order = create_order(1, {'1_7024_1': {'qty': -5, 'ral': '7024', 'product_id': '1', 'id_stock': '1'}})
+    assert order.line_count == 0
+    assert db.session.get(Stock, 1).count_stock == 1000
+
+
+def _add_batches(count):
+    db.session.add_all([Stock(id_stock=100 + i, id_product=1, count_stock=10, ral_stock='7024',
+                              date_stock=date(2024, 1, 1) + timedelta(days=i), expires_at_stock=date(2026, 1, 1))
+                        for i in range(count)])
+    db.session.commit()
+
+
+def _cart(stock_ids):
+    return {f'1_7024_{id_stock}': {'qty': 2, 'ral': '7024', 'product_id': '1', 'id_stock': str(id_stock)}
+            for id_stock in stock_ids}
+
+
+def test_reservation_query_count_does_not_depend_on_cart_size(catalog, count_queries):
+    _add_batches(50)
+    with count_queries() as small:
+        create_order(1, _cart([100]))
+    with count_queries() as large:
+        create_order(1, _cart(range(101, 150)))
+    assert large.count == small.count
+    assert db.session.get(Stock, 149).count_stock == 8
+
+
+def test_reserve_stocks_reports_only_short_batches(catalog):
+    _add_batches(2)
+    assert reserve_stocks({100: 4, 101: 11, 1: 5}) == [(101, 11)]
+    db.session.commit()
+    assert [db.session.get(Stock, id_stock).count_stock for id_stock in (1, 100, 101)] == [995, 6, 10]
+    with pytest.raises(OutOfStockError):
+        create_order(1, _cart([100, 101]) | {'1_7024_101': {'qty': 20, 'ral': '7024', 'product_id': '1', 'id_stock': '101'}})
+    assert db.session.get(Stock, 100).count_stock == 6
+
+
+def test_add_to_cart_rejects_non_positive_quantity(catalog, client_as):
+    client = client_as('buyer')
+    for qty in ('-3', '0', 'abc'):
+        client.post('/add_to_cart', data={'product_id': '1', 'qty': qty, 'id_stock': '1'})
+    with client.session_transaction() as flask_session:
+        assert not flask_session.get('cart')
+
+
+@pytest.fixture
+def shared_db(tmp_path):
+    """Отдельная база, к которой потоки ходят своими соединениями.
+
+    TEST_DATABASE_URL - PostgreSQL для проверки на боевой СУБД, иначе файл SQLite.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('TEST_DATABASE_URL', f"sqlite:///{tmp_path / 'stock.db'}")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        add_catalog()
+        db.session.get(Stock, 1).count_stock = 5
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+def test_parallel_reservations_never_oversell(shared_db):
+    threads_count = 20
+    barrier = threading.Barrier(threads_count)
+    results = []
+
+    def reserve():
+        with shared_db.app_context():
+            barrier.wait()
+            reserved = try_reserve_stock(1, 1)
+            db.session.commit()
+            results.append(reserved)
+
+    threads = [threading.Thread(target=reserve) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with shared_db.app_context():
+        assert db.session.get(Stock, 1).count_stock == 0
+    assert results.count(True) == 5
+    assert results.count(False) == threads_count - 5
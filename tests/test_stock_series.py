@@ -0,0 +1,60 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app.stock_series import get_stock_products_page
+
+SERIES = [
+    # id_stock, id_product, title, ral, date_stock, expires_at_stock, remaining
+    (1, 1, 'Грунт', '7024', '2025-01-01', '2026-06-01', 5),
+    (2, 1, 'Грунт', '7024', '2025-02-01', '2025-03-01', 7),
+    (3, 2, 'Эмаль', '9003', '2025-01-01', '2026-06-01', 10),
+    (4, 2, 'Эмаль', '7024', '2025-03-01', '2026-06-01', 3),
+    (5, 3, 'Лак', None, '2025-01-01', '2025-03-01', 4),
+    (6, 4, 'Эмаль', '3020', '2025-01-01', '2026-06-01', 8),
+]
+
+
+@pytest.fixture
+def stock_series(session):
+    # На SQLite вместо материализованного представления - таблица с теми же столбцами
+    session.execute(text("""
+        CREATE TABLE product_stock_series (
+            id_stock INTEGER PRIMARY KEY, id_product INTEGER, title_product TEXT,
+            nomenclature_product TEXT, ral_stock TEXT, date_stock DATE, expires_at_stock DATE,
+            nomenclature_ral TEXT, remaining_quantity INTEGER
+        )
+    """))
+    session.execute(text("""
+        INSERT INTO product_stock_series VALUES
+            (:id_stock, :id_product, :title, 'N', :ral, :date_stock, :expires, :nomenclature_ral, :qty)
+    """), [dict(id_stock=row[0], id_product=row[1], title=row[2], ral=row[3], date_stock=row[4],
+                expires=row[5], nomenclature_ral=f'N RAL {row[3]}', qty=row[6]) for row in SERIES])
+    session.commit()
+    yield
+    session.rollback()
+    session.execute(text('DROP TABLE product_stock_series'))
+    session.commit()
+
+
+def test_pages_follow_keyset_and_keep_filters_on_batches(stock_series):
+    today = date(2025, 6, 1)
+    groups, cursor = get_stock_products_page(per_page=2, min_shelf_days=0, today=today)
+    # Лак целиком просрочен, у Грунта остаётся одна партия
+    assert [(group['title'], group['id_product']) for group in groups] == [('Грунт', 1), ('Эмаль', 2)]
+    assert [batch['id_stock'] for batch in groups[0]['batches']] == [1]
+    assert groups[0]['total_quantity'] == 5
+    assert [batch['id_stock'] for batch in groups[1]['batches']] == [3, 4]
+    assert groups[1]['batches'][0]['date_stock'] == date(2025, 1, 1)
+
+    groups, cursor = get_stock_products_page(cursor=cursor, per_page=2, min_shelf_days=0, today=today)
+    assert [(group['title'], group['id_product']) for group in groups] == [('Эмаль', 4)]
+    assert cursor is None
+
+
+def test_search_applies_to_page_and_batches(stock_series):
+    groups, cursor = get_stock_products_page(min_shelf_days=None, search='7024')
+    assert [(group['id_product'], [batch['id_stock'] for batch in group['batches']]) for group in groups] \
+        == [(1, [1, 2]), (2, [4])]
+    assert cursor is None